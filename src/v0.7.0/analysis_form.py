@@ -4,10 +4,16 @@ import json
 import re
 import os
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from ollama import chat
 from auth import get_connection
+from chat_io import read_chat_file, chat_file_columns
+from database import init_db, insert_analysis_result
+from chat_log import get_log_writer
+from llm_cache import make_cache_key, get_cached_response, store_response, prune_cache, cache_stats
 import traceback
 LOG_DIR = Path("chat_logs")
 
@@ -16,6 +22,26 @@ MODEL_NAME = "deepseek-r1:8b"
 DATA_DIR = Path("user_progress")
 SCHEMA_VERSION = "0.7.0"
 INPUT_FILE = "output_form/cleaned_chat.xlsx"
+DEFAULT_WORKERS = 1
+USE_CACHE = True
+CHUNKED = False
+BY_SESSION = False
+STRUCTURED_OUTPUT = False
+NO_THINK = False
+STREAM = False
+LOG_BACKEND = "jsonl"  # "jsonl": compressed segments via chat_log, "files": one JSON file per attempt
+MAX_PREDICT = 1024  # Generation cap in no-reasoning mode, the JSON reply needs far less
+DEDUP_MIN_CHARS = 10  # Shorter messages are never treated as duplicates
+HALF_LIFE_DAYS = 30  # Incremental mode: stored scores lose half their weight every 30 days
+CHUNK_TOKENS = 3000  # Leaves room for SYSTEM_PROMPT and the reply in deepseek-r1's window
+
+# Bounds the number of in-flight Ollama requests across all scoring threads
+LLM_SEMAPHORE = threading.BoundedSemaphore(DEFAULT_WORKERS)
+WORKERS = DEFAULT_WORKERS
+
+# Per-run generation counters, printed after the report
+RUN_STATS_LOCK = threading.Lock()
+RUN_STATS = {"generations": 0, "retries": 0, "schema_fallbacks": 0, "eval_tokens": 0}
 
 COLLAB_CRITERIA = {
     "participation": "Discussion participation frequency",
@@ -56,33 +82,144 @@ Rules:
 3. Do not include any comments or additional formatting.
 """
 
+# JSON schema passed as Ollama's `format` in structured-output mode
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "feedback": {"type": "string"},
+        "scores": {
+            "type": "object",
+            "properties": {
+                k: {"type": "number", "minimum": 0, "maximum": 5}
+                for k in COLLAB_CRITERIA
+            },
+            "required": list(COLLAB_CRITERIA)
+        },
+        "mentions": {"type": "array", "items": {"type": "string"}},
+        "version": {"type": "string"}
+    },
+    "required": ["feedback", "scores"]
+}
+
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Team collaboration analysis tool')
     parser.add_argument('--input', 
                         default='output_form/cleaned_chat.xlsx',
-                        help='Input file path (default: output_form/cleaned_chat.xlsx)')
+                        help='Input file path, .xlsx/.parquet/.feather (default: output_form/cleaned_chat.xlsx)')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=DEFAULT_WORKERS,
+                        help='Number of talkers scored concurrently (default: 1)')
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='Always query the model, bypassing the response cache')
+    parser.add_argument('--chunked',
+                        action='store_true',
+                        help='Split long histories into token-budgeted windows and merge the scores')
+    parser.add_argument('--chunk-tokens',
+                        type=int,
+                        default=CHUNK_TOKENS,
+                        help=f'Token budget per window in chunked mode (default: {CHUNK_TOKENS})')
+    parser.add_argument('--by-session',
+                        action='store_true',
+                        help='Score each session_id (preprocess --sessions) separately and merge the scores')
+    parser.add_argument('--incremental',
+                        action='store_true',
+                        help="Only score messages newer than each talker's last analysis")
+    parser.add_argument('--dedup',
+                        action='store_true',
+                        help='Collapse exact and near-duplicate messages per talker before scoring')
+    parser.add_argument('--dedup-window',
+                        type=float,
+                        default=60,
+                        help='Minutes within which repeated messages are collapsed (default: 60)')
+    parser.add_argument('--dedup-threshold',
+                        type=float,
+                        default=0.85,
+                        help='Shingle Jaccard similarity treated as a near duplicate (default: 0.85)')
+    parser.add_argument('--structured',
+                        action='store_true',
+                        help='Request schema-constrained JSON output from Ollama')
+    parser.add_argument('--no-think',
+                        action='store_true',
+                        help='Disable deepseek-r1 reasoning, cap generation length and stop after the JSON')
+    parser.add_argument('--max-tokens',
+                        type=int,
+                        default=MAX_PREDICT,
+                        help=f'num_predict cap used with --no-think (default: {MAX_PREDICT})')
+    parser.add_argument('--stream',
+                        action='store_true',
+                        help='Stream replies and stop as soon as the JSON object is complete')
+    parser.add_argument('--log-backend',
+                        choices=['files', 'jsonl'],
+                        default=LOG_BACKEND,
+                        help='Chat log storage: compressed JSON lines or per-attempt JSON files (default: jsonl)')
     return parser.parse_args()
 
-def init_environment():
-    """Initialize environment"""
-    try:
-        DATA_DIR.mkdir(exist_ok=True)
-        if not os.path.exists(INPUT_FILE):
-            raise FileNotFoundError(f"{INPUT_FILE} does not exist")
-    except Exception as e:
-        print(f"Initialization error: {str(e)}")
-        exit(1)
+def configure_concurrency(workers: int) -> int:
+    """Resize the shared LLM request semaphore, returns the effective worker count"""
+    global LLM_SEMAPHORE, WORKERS
+    workers = max(1, int(workers))
+    LLM_SEMAPHORE = threading.BoundedSemaphore(workers)
+    WORKERS = workers
+    return workers
 
 def load_chat_data():
     """加载和预处理聊天数据（修复数据结构问题）"""
-    df = pd.read_excel(INPUT_FILE, sheet_name="Sheet1")
-    df = df[df['type_name'] == '文本']   # 只分析文本消息
+    # 按会话评分时额外读取预处理生成的 session_id 列
+    extra = ['session_id'] if BY_SESSION else []
+    if BY_SESSION and 'session_id' not in chat_file_columns(INPUT_FILE):
+        raise ValueError(f"{INPUT_FILE} has no session_id column; re-run preprocess_form.py "
+                         f"with --sessions before using --by-session")
+    df = read_chat_file(INPUT_FILE, columns=['CreateTime', 'talker', 'type_name', 'msg'] + extra)
+    df = df[df['type_name'] == '文本']   # 只分析文本消息（类别列上比较编码）
     
-    # 确保转换为字典列表
-    return df.groupby('talker').apply(
-        lambda x: x[['CreateTime', 'msg']].to_dict('records')
-    ).to_dict()
+    # 确保转换为字典列表：整表转换一次，再按 talker 编码分组取行
+    records = df[['CreateTime', 'msg'] + extra].to_dict('records')
+    groups = df.groupby('talker', observed=True).indices
+    return {talker: [records[i] for i in positions] for talker, positions in groups.items()}
+
+def normalize_for_dedup(text: str) -> str:
+    """Lowercase and drop whitespace/punctuation so trivially edited copies compare equal"""
+    return re.sub(r'[\W_]+', '', str(text).lower())
+
+def shingles(text: str, k: int = 3) -> set:
+    if len(text) <= k:
+        return {text}
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+def dedup_messages(messages: list, window_minutes: float, threshold: float) -> tuple:
+    """Collapse exact and near-duplicate messages of one talker within a time window
+
+    A message is dropped when, within window_minutes of an earlier kept
+    message, its normalized text is identical or its 3-character shingle
+    Jaccard similarity reaches threshold. Messages shorter than
+    DEDUP_MIN_CHARS after normalization are always kept, so repeated short
+    acknowledgements still count as participation. Returns the kept
+    messages and the estimated prompt tokens saved.
+    """
+    window = pd.Timedelta(minutes=window_minutes)
+    kept, recent, tokens_saved = [], [], 0
+    for rec in sorted(messages, key=lambda m: pd.Timestamp(m["CreateTime"])):
+        ts = pd.Timestamp(rec["CreateTime"])
+        norm = normalize_for_dedup(rec.get("msg", ""))
+        if len(norm) < DEDUP_MIN_CHARS:
+            kept.append(rec)
+            continue
+
+        recent = [r for r in recent if ts - r[0] <= window]
+        grams = shingles(norm)
+        duplicate = any(
+            norm == r_norm or len(grams & r_grams) / len(grams | r_grams) >= threshold
+            for _, r_norm, r_grams in recent
+        )
+        if duplicate:
+            tokens_saved += estimate_tokens(str(rec.get("msg", "")))
+            continue
+        kept.append(rec)
+        recent.append((ts, norm, grams))
+    return kept, tokens_saved
 
 def log_chat_interaction(talker: str, 
                         request: dict, 
@@ -91,8 +228,6 @@ def log_chat_interaction(talker: str,
                         error: str = ""):
     """记录完整的AI对话交互日志"""
     try:
-        LOG_DIR.mkdir(exist_ok=True)
-        
         log_data = {
             "timestamp": datetime.now().isoformat(),
             "talker": talker,
@@ -102,8 +237,13 @@ def log_chat_interaction(talker: str,
             "response": response,
             "error": error
         }
-        
-        filename = LOG_DIR / f"{talker}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+
+        if LOG_BACKEND == "jsonl":
+            get_log_writer().append(log_data)
+            return
+
+        LOG_DIR.mkdir(exist_ok=True)
+        filename = LOG_DIR / f"{talker}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json"
         
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(log_data, f, 
@@ -117,6 +257,8 @@ def log_chat_interaction(talker: str,
 def parse_llm_response(response: str) -> dict:
     try:
         response = response.encode('utf-8', 'ignore').decode('utf-8')
+        # Drop deepseek-r1 reasoning so braces inside it cannot confuse the extraction
+        response = re.sub(r'<think>[\s\S]*?</think>', '', response)
 
         # Extract the JSON part
         json_str = re.search(r'\{[\s\S]*\}', response)
@@ -166,28 +308,135 @@ def parse_llm_response(response: str) -> dict:
         print(f"Parsing error:{str(e)}")
         return {"error": str(e)}
     
-def analyze_collaboration(messages: list) -> dict:
+def build_context_lines(messages: list) -> list:
+    """Format each message as one numbered prompt line"""
     context_lines = []
     for i, rec in enumerate(messages):
         ts = rec.get("CreateTime")
         text = rec.get("msg", "").replace("\n", " ")
         context_lines.append(f"Article{i+1}, time：{ts}， Content: “{text}”")
+    return context_lines
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate: one token per CJK character, four characters per token otherwise"""
+    cjk = sum(1 for ch in text if '\u4e00' <= ch <= '\u9fff')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def split_into_windows(context_lines: list, token_budget: int) -> list:
+    """Greedily pack consecutive lines into windows of at most token_budget tokens"""
+    windows, current, used = [], [], 0
+    for line in context_lines:
+        cost = estimate_tokens(line)
+        if current and used + cost > token_budget:
+            windows.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += cost
+    if current:
+        windows.append(current)
+    return windows
+
+def merge_window_results(window_results: list, weights: list) -> dict:
+    """Reduce per-window analyses into one result
+
+    Scores are the token-weighted mean over valid windows (rounded to 2 decimals),
+    feedback is concatenated in window order and mentions are de-duplicated
+    keeping first occurrence, so the merge does not depend on completion order.
+    """
+    valid = [(r, w) for r, w in zip(window_results, weights) if is_valid_analysis(r)]
+    if not valid:
+        return window_results[0] if window_results else {"error": "No messages to analyze"}
+
+    total_weight = sum(w for _, w in valid)
+    merged_scores = {}
+    for criterion in COLLAB_CRITERIA:
+        weighted = 0.0
+        for result, weight in valid:
+            try:
+                weighted += float(result["scores"].get(criterion, 0)) * weight
+            except (TypeError, ValueError):
+                pass
+        merged_scores[criterion] = round(weighted / total_weight, 2)
+
+    feedback_parts, mentions = [], []
+    for idx, (result, _) in enumerate(valid, 1):
+        feedback_parts.append(f"[Part {idx}/{len(valid)}] {result['feedback'].strip()}")
+        for name in result.get("mentions", []):
+            if name not in mentions:
+                mentions.append(name)
+
+    return {
+        "feedback": "\n".join(feedback_parts),
+        "scores": merged_scores,
+        "mentions": mentions,
+        "version": SCHEMA_VERSION,
+        "chunks": len(window_results)
+    }
+
+def analyze_collaboration(messages: list) -> dict:
+    context_lines = build_context_lines(messages)
     context = "\n".join(context_lines)
 
+    if BY_SESSION:
+        # One window per session, long sessions are further split by the token budget
+        windows = []
+        for session_lines in group_lines_by_session(messages, context_lines):
+            windows.extend(split_into_windows(session_lines, CHUNK_TOKENS))
+    elif CHUNKED and estimate_tokens(context) > CHUNK_TOKENS:
+        windows = split_into_windows(context_lines, CHUNK_TOKENS)
+    else:
+        windows = None
+
+    if windows:
+        contexts = ["\n".join(window) for window in windows]
+        # Each window call still passes through LLM_SEMAPHORE, so more threads than workers would only wait
+        with ThreadPoolExecutor(max_workers=min(len(contexts), WORKERS)) as pool:
+            window_results = list(pool.map(lambda c: analyze_context(c, messages), contexts))
+        return merge_window_results(window_results, [estimate_tokens(c) for c in contexts])
+
+    return analyze_context(context, messages)
+
+def group_lines_by_session(messages: list, context_lines: list) -> list:
+    """Group prompt lines by the session_id of their message, in first-seen order"""
+    sessions = {}
+    for rec, line in zip(messages, context_lines):
+        sessions.setdefault(rec.get("session_id"), []).append(line)
+    return list(sessions.values())
+
+def analyze_context(context: str, messages: list) -> dict:
+    """Score one prompt context with the parse-and-retry loop"""
     max_retries = 5
     valid_result = None
     
     for attempt in range(max_retries):
         try:
+            temperature = min(0.3 + attempt*0.15, 0.7)
+            request = build_chat_request(context, temperature)
+            cache_key = make_cache_key(MODEL_NAME, SCHEMA_VERSION, SYSTEM_PROMPT, context, temperature,
+                                       extra={"format": request.get("format"),
+                                              "think": request.get("think"),
+                                              "num_predict": request["options"].get("num_predict"),
+                                              "stop": request["options"].get("stop")})
+            cached = get_cached_response(cache_key) if USE_CACHE else None
+            if cached is not None:
+                result = parse_analysis(cached)
+                if is_valid_analysis(result):
+                    valid_result = result
+                    break
+                continue
+
             # Parameter passing
-            response = chat(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": context}
-                ],
-                options={"temperature": min(0.3 + attempt*0.15, 0.7)} 
-            )
+            with LLM_SEMAPHORE:
+                # No-think replies end at the JSON object's closing brace, found by the
+                # stream detector; fixed stop strings could also match before the object
+                if STREAM or NO_THINK:
+                    content, eval_tokens = stream_chat(request)
+                else:
+                    response = chat(**request)
+                    content, eval_tokens = response['message']['content'], response.get('eval_count') or 0
+            record_generation(attempt, eval_tokens)
+            if USE_CACHE:
+                store_response(cache_key, content)
             
             # Add type checking
             if isinstance(messages, list) and len(messages) > 0:
@@ -198,19 +447,12 @@ def analyze_collaboration(messages: list) -> dict:
             # Keep a log
             log_chat_interaction(
                 talker=talker,
-                request={
-                    "model": MODEL_NAME,
-                    "messages": [
-                        {"role": "system", "content": SYSTEM_PROMPT},
-                        {"role": "user", "content": context}
-                    ],
-                    "options": {"temperature": min(0.3 + attempt*0.15, 0.7)}
-                },
-                response=response['message']['content'],
+                request=request,
+                response=content,
                 attempt=attempt+1
             )
             
-            result = parse_llm_response(response['message']['content'])
+            result = parse_analysis(content)
             
             if is_valid_analysis(result):
                 valid_result = result
@@ -225,6 +467,154 @@ def analyze_collaboration(messages: list) -> dict:
     
     return valid_result or result
 
+def build_chat_request(context: str, temperature: float) -> dict:
+    """Assemble the keyword arguments of one Ollama chat call"""
+    request = {
+        "model": MODEL_NAME,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": context}
+        ],
+        "options": {"temperature": temperature}
+    }
+    if STRUCTURED_OUTPUT:
+        request["format"] = ANALYSIS_SCHEMA
+    if NO_THINK:
+        request["think"] = False
+        request["options"]["num_predict"] = MAX_PREDICT
+    return request
+
+class JsonObjectDetector:
+    """Incremental balanced-brace detector for the first top-level JSON object
+
+    Text inside <think>...</think> and inside JSON strings is ignored, so only
+    structural braces of the answer move the depth counter.
+    """
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.in_think = False
+        self.complete = False
+
+    def feed(self, chunk: str) -> bool:
+        """Consume the next chunk, returns True once the object is closed"""
+        self.text += chunk
+        while self.pos < len(self.text) and not self.complete:
+            rest = self.text[self.pos:self.pos + 8]
+            if not self.in_string:
+                tag = "</think>" if self.in_think else "<think>"
+                if rest.startswith(tag):
+                    self.in_think = not self.in_think
+                    self.pos += len(tag)
+                    continue
+                if tag.startswith(rest) and self.pos + len(rest) == len(self.text):
+                    break  # Possible tag split across chunks, wait for more text
+            if self.in_think:
+                self.pos += 1
+                continue
+
+            ch = self.text[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.depth > 0:
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}" and self.depth > 0:
+                self.depth -= 1
+                self.complete = self.depth == 0
+            self.pos += 1
+        return self.complete
+
+def stream_chat(request: dict) -> tuple:
+    """Stream a chat reply and stop generating once a complete JSON object has arrived
+
+    Returns the full received text and the number of generated tokens (Ollama's
+    eval_count when the stream finished, otherwise the chunks received).
+    """
+    detector = JsonObjectDetector()
+    parts, chunks, eval_tokens = [], 0, 0
+    stream = chat(**request, stream=True)
+    try:
+        for chunk in stream:
+            text = chunk['message']['content'] or ""
+            parts.append(text)
+            chunks += 1
+            if chunk.get('done'):
+                eval_tokens = chunk.get('eval_count') or 0
+            if detector.feed(text):
+                break
+    finally:
+        # Closing the generator drops the HTTP stream, which aborts the generation
+        if hasattr(stream, "close"):
+            stream.close()
+    return "".join(parts), eval_tokens or chunks
+
+def parse_analysis(response: str) -> dict:
+    """Parse a reply, trying the strict schema path first in structured mode"""
+    if STRUCTURED_OUTPUT:
+        result = parse_structured_response(response)
+        if 'error' not in result:
+            return result
+        record_fallback()
+    return parse_llm_response(response)
+
+def parse_structured_response(response: str) -> dict:
+    """Load a constrained-output reply and check it against ANALYSIS_SCHEMA"""
+    try:
+        parsed = json.loads(response)
+    except json.JSONDecodeError as e:
+        return {"error": f"Schema output is not JSON: {str(e)}"}
+    problem = validate_analysis_schema(parsed)
+    if problem:
+        return {"error": problem}
+    return {
+        "feedback": parsed["feedback"],
+        "scores": {k: float(parsed["scores"][k]) for k in COLLAB_CRITERIA},
+        "mentions": parsed.get("mentions", []),
+        "version": parsed.get("version", SCHEMA_VERSION)
+    }
+
+def validate_analysis_schema(data) -> str:
+    """Return a description of the first schema violation, or an empty string"""
+    if not isinstance(data, dict):
+        return "Top-level value is not an object"
+    if not isinstance(data.get("feedback"), str):
+        return "feedback must be a string"
+    scores = data.get("scores")
+    if not isinstance(scores, dict):
+        return "scores must be an object"
+    for criterion in COLLAB_CRITERIA:
+        value = scores.get(criterion)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"scores.{criterion} must be a number"
+        if not 0 <= value <= 5:
+            return f"scores.{criterion} is outside 0-5"
+    mentions = data.get("mentions", [])
+    if not isinstance(mentions, list) or not all(isinstance(m, str) for m in mentions):
+        return "mentions must be a list of strings"
+    return ""
+
+def record_generation(attempt: int, eval_tokens: int = 0):
+    """Count one model generation, its generated tokens and the attempt it belonged to"""
+    with RUN_STATS_LOCK:
+        RUN_STATS["generations"] += 1
+        RUN_STATS["eval_tokens"] += eval_tokens
+        if attempt > 0:
+            RUN_STATS["retries"] += 1
+
+def record_fallback():
+    with RUN_STATS_LOCK:
+        RUN_STATS["schema_fallbacks"] += 1
+
 def is_valid_analysis(analysis: dict) -> bool:
     """Verify the validity of the analysis results"""
     if 'error' in analysis:
@@ -302,6 +692,84 @@ def parse_group_from_filename(file_path):
     except:
         return "default_group"
 
+def load_watermarks(group_name: str) -> dict:
+    """Load the per-talker high-water marks of the previous incremental runs"""
+    try:
+        with get_connection() as conn:
+            rows = conn.execute('''
+                SELECT talker, last_create_time, scores, message_weight
+                FROM analysis_watermarks
+                WHERE group_name = ?
+            ''', (group_name,)).fetchall()
+        return {
+            talker: {
+                "last_create_time": pd.Timestamp(last_time),
+                "scores": json.loads(scores),
+                "message_weight": weight
+            }
+            for talker, last_time, scores, weight in rows
+        }
+    except Exception as e:
+        print(f"Watermark loading failed: {str(e)}")
+        return {}
+
+def filter_new_messages(messages: list, watermark: dict) -> list:
+    """Keep only the messages strictly after the stored CreateTime"""
+    if not watermark:
+        return messages
+    cutoff = watermark["last_create_time"]
+    return [m for m in messages if pd.Timestamp(m["CreateTime"]) > cutoff]
+
+def combine_with_history(analysis: dict, watermark: dict, new_messages: list) -> tuple:
+    """Blend new scores with the stored ones using a time-decayed weighting
+
+    The stored scores carry the message weight accumulated so far, decayed by
+    0.5 ** (elapsed_days / HALF_LIFE_DAYS), where elapsed_days is the gap between
+    the old high-water mark and the newest new message. The new scores weigh
+    the number of new messages. Each score is the weighted mean of the two;
+    returns the combined analysis and the weight to store for the next run.
+    """
+    new_weight = float(len(new_messages))
+    if not watermark or not is_valid_analysis(analysis):
+        return analysis, new_weight
+
+    newest = max(pd.Timestamp(m["CreateTime"]) for m in new_messages)
+    elapsed_days = max(0.0, (newest - watermark["last_create_time"]).total_seconds() / 86400)
+    old_weight = watermark["message_weight"] * 0.5 ** (elapsed_days / HALF_LIFE_DAYS)
+    total = old_weight + new_weight
+
+    combined = {}
+    for criterion in COLLAB_CRITERIA:
+        try:
+            new_score = float(analysis["scores"].get(criterion, 0))
+        except (TypeError, ValueError):
+            new_score = 0.0
+        old_score = float(watermark["scores"].get(criterion, 0))
+        combined[criterion] = round((old_score * old_weight + new_score * new_weight) / total, 2)
+    return {**analysis, "scores": combined}, total
+
+def update_watermark(group_name: str, talker: str, analysis: dict, new_messages: list, weight: float):
+    """Advance the talker's high-water mark after a valid analysis"""
+    if not new_messages or not is_valid_analysis(analysis):
+        return
+    newest = max(pd.Timestamp(m["CreateTime"]) for m in new_messages)
+    try:
+        with get_connection() as conn:
+            conn.execute('''
+                INSERT INTO analysis_watermarks
+                (talker, group_name, last_create_time, scores, message_weight, analyzed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(talker, group_name)
+                DO UPDATE SET last_create_time = excluded.last_create_time,
+                              scores = excluded.scores,
+                              message_weight = excluded.message_weight,
+                              analyzed_at = excluded.analyzed_at
+            ''', (talker, group_name, newest.isoformat(),
+                  json.dumps(analysis["scores"]), weight, datetime.now().isoformat()))
+            conn.commit()
+    except Exception as e:
+        print(f"Watermark update failed: {str(e)}")
+
 def save_results(talker: str, analysis: dict, id_mapping: dict):
     # Verify the validity of the score
     validated_scores = {}
@@ -323,27 +791,141 @@ def save_results(talker: str, analysis: dict, id_mapping: dict):
         "group": parse_group_from_filename(INPUT_FILE)
     }
 
-    filename = DATA_DIR / f"{talker}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    # Microseconds keep reruns within the same second from sharing a file (and DB key)
+    filename = DATA_DIR / f"{talker}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json"
     try:
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(record, f, indent=2, ensure_ascii=False)
     except Exception as e:
         print(f"Save failed: {str(e)}")
 
-def main():
-    args = parse_args()
-    INPUT_FILE = args.input
-    init_environment()
+    # Dual-write to the indexed results table used by the report views
+    try:
+        with get_connection() as conn:
+            insert_analysis_result(conn, record, filename.name)
+            conn.commit()
+    except Exception as e:
+        print(f"Database save failed: {str(e)}")
+
+def run_analysis(input_file: str, workers: int = DEFAULT_WORKERS, use_cache: bool = True,
+                 chunked: bool = False, chunk_tokens: int = CHUNK_TOKENS, by_session: bool = False,
+                 incremental: bool = False, dedup: bool = False, dedup_window: float = 60,
+                 dedup_threshold: float = 0.85, structured: bool = False, no_think: bool = False,
+                 max_tokens: int = MAX_PREDICT, stream: bool = False, log_backend: str = LOG_BACKEND,
+                 progress=None) -> dict:
+    """In-process analysis entry point shared by the CLI and the UI
+
+    Options mirror the command line flags. `progress(done, total, talker)` is
+    called after each talker is scored. Returns the per-talker results plus
+    run counters; raises instead of exiting so a long-lived caller survives.
+    """
+    global INPUT_FILE, USE_CACHE, CHUNKED, BY_SESSION, CHUNK_TOKENS, STRUCTURED_OUTPUT, NO_THINK, MAX_PREDICT, STREAM, LOG_BACKEND
+    INPUT_FILE = input_file
+    if not os.path.exists(INPUT_FILE):
+        raise FileNotFoundError(f"{INPUT_FILE} does not exist")
+    DATA_DIR.mkdir(exist_ok=True)
+    init_db()  # Before any DB access: a fresh database has no id_mappings table yet
+    BY_SESSION = by_session
+    USE_CACHE = use_cache
+    CHUNKED = chunked
+    STRUCTURED_OUTPUT = structured
+    NO_THINK = no_think
+    MAX_PREDICT = max(1, max_tokens)
+    STREAM = stream
+    LOG_BACKEND = log_backend
+    CHUNK_TOKENS = max(1, chunk_tokens)
+    with RUN_STATS_LOCK:
+        for key in RUN_STATS:
+            RUN_STATS[key] = 0
+    cache_before = cache_stats()
+
     chat_data = load_chat_data()
+    dedup_dropped, dedup_saved = 0, 0
+    if dedup:
+        for talker, messages in chat_data.items():
+            kept, saved = dedup_messages(messages, dedup_window, dedup_threshold)
+            dedup_dropped += len(messages) - len(kept)
+            dedup_saved += saved
+            chat_data[talker] = kept
     id_mapping = get_id_mapping(INPUT_FILE)
-    
+    workers = configure_concurrency(workers)
+    if USE_CACHE:
+        prune_cache()
+
+    group_name = parse_group_from_filename(INPUT_FILE)
+    watermarks = {}
+    if incremental:
+        watermarks = load_watermarks(group_name)
+        chat_data = {
+            talker: filter_new_messages(messages, watermarks.get(talker))
+            for talker, messages in chat_data.items()
+        }
+
     results = {}
-    for talker, messages in chat_data.items():
-        analysis = analyze_collaboration(messages)
-        save_results(talker, analysis, id_mapping) 
-        results[talker] = analysis
-    
-    generate_report(results, INPUT_FILE)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            talker: pool.submit(analyze_collaboration, messages)
+            for talker, messages in chat_data.items()
+            if messages
+        }
+        # Collect in input order so reports match the sequential run
+        for talker, future in futures.items():
+            analysis = future.result()
+            if incremental:
+                analysis, weight = combine_with_history(analysis, watermarks.get(talker), chat_data[talker])
+                update_watermark(group_name, talker, analysis, chat_data[talker], weight)
+            save_results(talker, analysis, id_mapping)
+            results[talker] = analysis
+            if progress:
+                progress(len(results), len(futures), talker)
+
+    cache_after = cache_stats()
+    return {
+        "input": INPUT_FILE,
+        "results": results,
+        "skipped": len(chat_data) - len(results),
+        "dedup": {"dropped": dedup_dropped, "tokens_saved": dedup_saved},
+        "stats": dict(RUN_STATS),
+        "cache": {k: cache_after[k] - cache_before.get(k, 0) for k in cache_after} if USE_CACHE else None
+    }
+
+def print_run_summary(run: dict):
+    """Console summary of a run_analysis result"""
+    stats = run["stats"]
+    generations = stats['generations']
+    print(f"\nLLM generations: {generations} "
+          f"({stats['retries']} retries, {stats['schema_fallbacks']} schema fallbacks)")
+    if generations:
+        print(f"Generated tokens: {stats['eval_tokens']} total, "
+              f"{stats['eval_tokens'] / generations:.0f} per call"
+              f"{' (no-think mode)' if NO_THINK else ''}")
+    if run["cache"] is not None:
+        cache = run["cache"]
+        print(f"\nLLM cache: {cache['hits']} hits, {cache['misses']} misses, {cache['writes']} writes")
+
+def main():
+    args = parse_args()
+    try:
+        run = run_analysis(
+            args.input, workers=args.workers, use_cache=not args.no_cache,
+            chunked=args.chunked, chunk_tokens=args.chunk_tokens, by_session=args.by_session,
+            incremental=args.incremental, dedup=args.dedup, dedup_window=args.dedup_window,
+            dedup_threshold=args.dedup_threshold, structured=args.structured,
+            no_think=args.no_think, max_tokens=args.max_tokens, stream=args.stream,
+            log_backend=args.log_backend
+        )
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Initialization error: {str(e)}")
+        exit(1)
+
+    if args.dedup:
+        print(f"Dedup: removed {run['dedup']['dropped']} duplicate messages, "
+              f"~{run['dedup']['tokens_saved']} prompt tokens saved")
+    if run["skipped"]:
+        print(f"Skipped {run['skipped']} talkers with no new messages")
+
+    generate_report(run["results"], run["input"])
+    print_run_summary(run)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
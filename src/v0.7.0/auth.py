@@ -3,17 +3,22 @@ import sys
 import os
 import sqlite3
 import hashlib
+import argparse
+import atexit
+import threading
 import pandas as pd
 from pathlib import Path
-from database import init_db
+from database import init_db, get_connection
+from chat_io import read_chat_file, list_chat_files
 
-DB_PATH = Path("user_inform") / "system.db"
+# user_mapping.xlsx 是 id_mappings 表的派生导出：修改映射只写数据库并标记过期，
+# 静默 EXPORT_DEBOUNCE_SECONDS 秒后（或进程退出、手动“立即导出”时）统一重新生成
+MAPPING_EXPORT_PATH = Path("user_inform") / "user_mapping.xlsx"
+EXPORT_DEBOUNCE_SECONDS = 5.0
 
-def get_connection():
-    """Unify the database connection entry"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys = ON")
-    return conn
+_export_lock = threading.Lock()        # 保护过期标记和计时器
+_export_write_lock = threading.Lock()  # 同一时间只有一个导出在写文件
+_export_state = {"dirty": False, "timer": None}
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -186,7 +191,7 @@ def transfer_leadership(old_leader: str, new_leader: str, group_name: str) -> bo
 def select_output_file():
     """Select the preprocessed chat file"""
     output_dir = Path("output_form")
-    files = [f for f in output_dir.glob("*.xlsx") if f.is_file()]
+    files = list_chat_files(output_dir)
     
     print("\nAvailable preprocessing files：")
     for i, f in enumerate(files, 1):
@@ -203,17 +208,15 @@ def select_output_file():
 def get_original_ids(file_path):
     """Obtain the original ID list from the specified file"""
     try:
-        df = pd.read_excel(file_path, engine='openpyxl')
+        df = read_chat_file(file_path, columns=['talker'])
         return df['talker'].unique().tolist()
     except Exception as e:
         print(f"File reading failed: {str(e)}")
         return []
 
 def init_mapping_file():
-    mapping_path = Path("user_inform/user_mapping.xlsx")
-    if not mapping_path.exists():
-        pd.DataFrame(columns=['group', 'original_id', 'system_id']).to_excel(
-            mapping_path, index=False, engine='openpyxl')
+    if not MAPPING_EXPORT_PATH.exists():
+        export_mapping_file()
 
 def enhanced_process_mapping(group_name: str, file_path: Path):
     clear_screen()
@@ -235,42 +238,31 @@ def enhanced_process_mapping(group_name: str, file_path: Path):
         print("3. Hybrid mode (Free selection of partial ID mapping)")
         mode = input("Please enter the option (1/2/3): ").strip()
 
-        success_count = 0
-        with get_connection() as conn:
-            for idx, original_id in enumerate(original_ids, 1):
-                # 混合模式逻辑
-                if mode == '3':
-                    print(f"\nCurrent processing ({idx}/{len(original_ids)}): {original_id}")
-                    action = input("Is it manually mapped? (y= manual /n= automatic /q= Exit): ").lower()
-                    if action == 'q':
-                        break
-                    elif action == 'y':
-                        system_id = input(f"Please enter the system ID: ").strip()
-                        if not system_id:
-                            print("skip ID")
-                            continue
-                    else:
-                        system_id = original_id
+        # 先收集全部映射，再一次性校验并写入
+        pairs = []
+        for idx, original_id in enumerate(original_ids, 1):
+            # 混合模式逻辑
+            if mode == '3':
+                print(f"\nCurrent processing ({idx}/{len(original_ids)}): {original_id}")
+                action = input("Is it manually mapped? (y= manual /n= automatic /q= Exit): ").lower()
+                if action == 'q':
+                    break
+                elif action == 'y':
+                    system_id = input(f"Please enter the system ID: ").strip()
+                    if not system_id:
+                        print("skip ID")
+                        continue
                 else:
-                    system_id = original_id if mode == '1' else input(f"Please input'{original_id}'ID: ")
+                    system_id = original_id
+            else:
+                system_id = original_id if mode == '1' else input(f"Please input'{original_id}'ID: ")
+            pairs.append((original_id, system_id))
 
-                if not check_user_exists(system_id):
-                    print(f"error：ID '{system_id}' Unregistered")
-                    continue
-
-                try:
-                    conn.execute('''
-                        INSERT INTO id_mappings (original_id, system_id, group_name)
-                        VALUES (?, ?, ?)
-                        ON CONFLICT(original_id, group_name) 
-                        DO UPDATE SET system_id = excluded.system_id
-                    ''', (original_id, system_id, group_name))
-                    success_count += 1
-                except sqlite3.Error as e:
-                    print(f"Save failed: {original_id} → {system_id} ({str(e)})")
-
-            conn.commit()
-            print(f"\nSuccessful import {success_count}/{len(original_ids)} mapping relationship")
+        report = bulk_import_mappings(group_name, pairs)
+        for original_id, system_id, reason in report["rejected"]:
+            if reason == "unregistered":
+                print(f"error：ID '{system_id}' Unregistered")
+        print(f"\nSuccessful import {len(report['accepted'])}/{len(original_ids)} mapping relationship")
 
     except Exception as e:
         print(f"导入失败: {str(e)}")
@@ -288,9 +280,10 @@ def update_user_mapping(group_name):
         print("2. 手动添加/修改映射")
         print("3. 删除映射")
         print("4. 从文件批量导入")
-        print("5. 返回群组管理")
+        print("5. 立即导出Excel映射文件")
+        print("6. 返回群组管理")
         
-        choice = input("请输入选项 (1-5): ").strip()
+        choice = input("请输入选项 (1-6): ").strip()
         
         if choice == '1':
             view_mappings(group_name)
@@ -304,6 +297,8 @@ def update_user_mapping(group_name):
             if chat_file:
                 enhanced_process_mapping(group_name, chat_file)  # 调用增强版函数
         elif choice == '5':
+            print(f"已导出 {export_mapping_file()} 条映射到 {MAPPING_EXPORT_PATH}")
+        elif choice == '6':
             break
         else:
             print("无效输入")
@@ -341,14 +336,9 @@ def manual_edit_mapping(group_name):
                     DO UPDATE SET system_id = excluded.system_id
                 ''', (original_id, system_id, group_name))
                 
-                # 同步更新Excel映射文件（可选）
-                update_excel_mapping(
-                    group_name=group_name,
-                    original_id=original_id,
-                    system_id=system_id
-                )
-                
                 conn.commit()
+                # Excel 映射文件稍后统一导出
+                mark_mappings_changed()
                 print(f"成功保存映射关系：{original_id} → {system_id}")
                 
         except sqlite3.Error as e:
@@ -396,33 +386,96 @@ def check_user_exists(username: str) -> bool:
     except sqlite3.Error:
         return False
 
-def update_excel_mapping(group_name: str, original_id: str, system_id: str):
-    """同步更新Excel映射文件（保持兼容性）"""
+def bulk_import_mappings(group_name: str, pairs) -> dict:
+    """批量写入 (original_id, system_id) 映射
+
+    映射先写入临时表，再用一条 JOIN users 的查询找出未注册的系统ID，
+    一条 INSERT ... SELECT 完成全部 UPSERT，整个过程在同一事务中。
+    同一原始ID出现多次时以最后一次为准。
+    返回 {"accepted": [(original_id, system_id)], "rejected": [(original_id, system_id, reason)]}。
+    """
+    latest = {}
+    rejected = []
+    for original_id, system_id in pairs:
+        original_id, system_id = str(original_id).strip(), str(system_id or '').strip()
+        if not original_id or not system_id:
+            rejected.append((original_id, system_id, "empty"))
+            continue
+        latest[original_id] = system_id
+
+    with get_connection() as conn:
+        conn.execute('''CREATE TEMP TABLE IF NOT EXISTS import_mappings
+                        (original_id TEXT PRIMARY KEY, system_id TEXT NOT NULL)''')
+        conn.execute("DELETE FROM import_mappings")
+        conn.executemany("INSERT INTO import_mappings VALUES (?, ?)", latest.items())
+        unregistered = {row[0] for row in conn.execute('''
+            SELECT i.original_id FROM import_mappings i
+            LEFT JOIN users u ON u.username = i.system_id
+            WHERE u.username IS NULL
+        ''')}
+        conn.execute('''
+            INSERT INTO id_mappings (original_id, system_id, group_name)
+            SELECT i.original_id, i.system_id, ? FROM import_mappings i
+            JOIN users u ON u.username = i.system_id
+            WHERE true
+            ON CONFLICT(original_id, group_name)
+            DO UPDATE SET system_id = excluded.system_id
+        ''', (group_name,))
+        conn.execute("DELETE FROM import_mappings")
+
+    if len(latest) > len(unregistered):
+        mark_mappings_changed()
+    accepted = [(o, s) for o, s in latest.items() if o not in unregistered]
+    rejected += [(o, s, "unregistered") for o, s in latest.items() if o in unregistered]
+    return {"accepted": accepted, "rejected": rejected}
+
+def export_mapping_file(path: Path = MAPPING_EXPORT_PATH) -> int:
+    """从 id_mappings 表全量生成 Excel 映射文件，返回导出的行数"""
+    with _export_write_lock:
+        with get_connection() as conn:
+            df = pd.read_sql('''
+                SELECT group_name AS "group", original_id, system_id
+                FROM id_mappings
+                ORDER BY group_name, original_id
+            ''', conn)
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True)
+        # 先写临时文件再替换，导出中途失败不会留下损坏的工作簿
+        tmp_path = path.with_name(f"~tmp_{path.name}")
+        df.to_excel(tmp_path, index=False, engine='openpyxl')
+        os.replace(tmp_path, path)
+        return len(df)
+
+def mark_mappings_changed():
+    """映射已修改：标记 Excel 导出过期并重新开始防抖计时"""
+    with _export_lock:
+        _export_state["dirty"] = True
+        if _export_state["timer"] is not None:
+            _export_state["timer"].cancel()
+        timer = threading.Timer(EXPORT_DEBOUNCE_SECONDS, flush_mapping_export)
+        timer.daemon = True
+        timer.start()
+        _export_state["timer"] = timer
+
+def flush_mapping_export() -> bool:
+    """有未导出的修改时立即导出，返回是否执行了导出"""
+    with _export_lock:
+        if not _export_state["dirty"]:
+            return False
+        _export_state["dirty"] = False
+        if _export_state["timer"] is not None:
+            _export_state["timer"].cancel()
+            _export_state["timer"] = None
     try:
-        mapping_path = Path("user_inform/user_mapping.xlsx")
-        
-        # 读取现有数据
-        if mapping_path.exists():
-            df = pd.read_excel(mapping_path, engine='openpyxl')
-        else:
-            df = pd.DataFrame(columns=['group', 'original_id', 'system_id'])
-        
-        # 删除旧记录
-        mask = (df['group'] == group_name) & (df['original_id'] == original_id)
-        df = df[~mask]
-        
-        # 添加新记录
-        new_row = pd.DataFrame([{
-            'group': group_name,
-            'original_id': original_id,
-            'system_id': system_id
-        }])
-        df = pd.concat([df, new_row], ignore_index=True)
-        
-        # 保存文件
-        df.to_excel(mapping_path, index=False, engine='openpyxl')
+        export_mapping_file()
+        return True
     except Exception as e:
-        print(f"警告：Excel映射文件更新失败（不影响数据库操作）: {str(e)}")
+        with _export_lock:
+            _export_state["dirty"] = True
+        print(f"警告：Excel映射文件导出失败（不影响数据库操作）: {str(e)}")
+        return False
+
+atexit.register(flush_mapping_export)
 
 def process_file_mapping(group_name: str, file_path: Path):
     """从预处理文件批量导入映射关系"""
@@ -447,37 +500,23 @@ def process_file_mapping(group_name: str, file_path: Path):
         print("2. 手动为每个原始ID指定系统ID")
         mode = input("请输入选项 (1/2): ").strip()
 
-        # 执行映射
-        success_count = 0
-        with get_connection() as conn:
-            for original_id in original_ids:
-                if mode == '1':
-                    system_id = original_id  # 自动映射
-                else:
-                    system_id = input(f"请输入原始ID '{original_id}' 对应的系统ID: ").strip()
-                    if not system_id:
-                        print(f"跳过 {original_id}")
-                        continue
-
-                # 验证系统ID有效性
-                if not check_user_exists(system_id):
-                    print(f"错误：系统ID '{system_id}' 未注册")
+        # 收集映射后一次性校验并写入
+        pairs = []
+        for original_id in original_ids:
+            if mode == '1':
+                system_id = original_id  # 自动映射
+            else:
+                system_id = input(f"请输入原始ID '{original_id}' 对应的系统ID: ").strip()
+                if not system_id:
+                    print(f"跳过 {original_id}")
                     continue
+            pairs.append((original_id, system_id))
 
-                # 写入数据库
-                try:
-                    conn.execute('''
-                        INSERT INTO id_mappings (original_id, system_id, group_name)
-                        VALUES (?, ?, ?)
-                        ON CONFLICT(original_id, group_name) 
-                        DO UPDATE SET system_id = excluded.system_id
-                    ''', (original_id, system_id, group_name))
-                    success_count += 1
-                except sqlite3.Error as e:
-                    print(f"保存失败: {original_id} → {system_id} ({str(e)})")
-
-            conn.commit()
-            print(f"\n成功导入 {success_count}/{len(original_ids)} 条映射关系")
+        report = bulk_import_mappings(group_name, pairs)
+        for original_id, system_id, reason in report["rejected"]:
+            if reason == "unregistered":
+                print(f"错误：系统ID '{system_id}' 未注册")
+        print(f"\n成功导入 {len(report['accepted'])}/{len(original_ids)} 条映射关系")
 
     except Exception as e:
         print(f"批量导入失败: {str(e)}")
@@ -487,10 +526,7 @@ def process_file_mapping(group_name: str, file_path: Path):
 def select_output_file():
     """选择预处理文件（增加临时文件过滤）"""
     output_dir = Path("output_form")
-    files = [
-        f for f in output_dir.glob("*.xlsx") 
-        if f.is_file() and not f.name.startswith('~$')
-    ]
+    files = list_chat_files(output_dir) if output_dir.exists() else []
     
     if not files:
         print("没有可用的预处理文件")
@@ -549,37 +585,20 @@ def view_mappings(group_name: str):
         print(f"保存失败: {str(e)}")
         conn.rollback()
     """保存映射关系到Excel"""
-    try:
-        # 确保映射文件存在
-        mapping_path = Path("user_inform/user_mapping.xlsx")
-        mapping_path.parent.mkdir(exist_ok=True)
-        
-        if mapping_path.exists():
-            df = pd.read_excel(mapping_path, engine='openpyxl')
-        else:
-            df = pd.DataFrame(columns=['group', 'original_id', 'system_id'])
-
-        # 删除旧记录
-        mask = (df['group'] == group_name) & (df['original_id'] == original_id)
-        df = df[~mask]
-
-        # 添加新记录
-        new_row = pd.DataFrame([{
-            'group': group_name,
-            'original_id': original_id,
-            'system_id': system_id
-        }])
-        df = pd.concat([df, new_row], ignore_index=True)
-
-        # 保存文件
-        df.to_excel(mapping_path, index=False, engine='openpyxl')
-        print("映射关系保存成功！")
-        
-    except Exception as e:
-        print(f"保存失败：{str(e)}")
+    mark_mappings_changed()
+    print("映射关系保存成功！")
 
 def clear_screen():
     os.system('cls' if os.name == 'nt' else 'clear')
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='User and ID mapping management')
+    parser.add_argument('--export-mappings', action='store_true',
+                        help=f'Regenerate {MAPPING_EXPORT_PATH} from the id_mappings table now')
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    args = parse_args()
+    init_db()
+    if args.export_mappings:
+        print(f"已导出 {export_mapping_file()} 条映射到 {MAPPING_EXPORT_PATH}")
\ No newline at end of file
@@ -0,0 +1,91 @@
+# benchmark_analysis.py
+# End-to-end throughput benchmark of analysis_form.py against mock_ollama.py
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from mock_ollama import MockConfig, start_server
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+BENCH_INPUT = "output_form/cleaned_chat.xlsx"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Analysis pipeline benchmark (offline)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                        help='Talker counts to benchmark (default: 10 100 1000)')
+    parser.add_argument('--messages', type=int, default=20, help='Messages per talker (default: 20)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mock seconds of delay per request')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Mock share of invalid replies')
+    parser.add_argument('--eval-tokens', type=int, default=200, help='Mock eval_count per reply')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for data generation and the mock')
+    # Everything else (e.g. --workers 4 --stream) is passed through to analysis_form.py
+    return parser.parse_known_args()
+
+def build_chat_file(path: Path, talkers: int, messages: int):
+    """Write a synthetic cleaned chat with the preprocess_form column layout"""
+    start = datetime(2025, 3, 1, 9, 0)
+    rows = []
+    for t in range(talkers):
+        for m in range(messages):
+            rows.append({
+                "CreateTime": start + timedelta(minutes=t * messages + m),
+                "talker": f"wxid_bench{t:05d}",
+                "type_name": "文本",
+                "msg": f"Member {t} message {m}: I will take the report draft and sync with the team."
+            })
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(rows).to_excel(path, index=False, engine='openpyxl')
+
+def run_size(talkers: int, args, extra_args: list, host: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bench_analysis_") as workdir:
+        workdir = Path(workdir)
+        build_chat_file(workdir / BENCH_INPUT, talkers, args.messages)
+
+        env = {**os.environ, "OLLAMA_HOST": host, "PYTHONIOENCODING": "utf-8"}
+        cmd = [sys.executable, str(SCRIPT_DIR / "analysis_form.py"),
+               "--input", BENCH_INPUT, "--no-cache", *extra_args]
+        started = time.perf_counter()
+        result = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True,
+                                text=True, encoding='utf-8', errors='replace')
+        elapsed = time.perf_counter() - started
+
+        if result.returncode != 0:
+            print(result.stdout[-2000:])
+            print(result.stderr[-2000:])
+            raise RuntimeError(f"analysis_form.py exited with {result.returncode}")
+
+        generations = next((line for line in result.stdout.splitlines()
+                            if line.startswith("LLM generations:")), "")
+        return {
+            "talkers": talkers,
+            "seconds": elapsed,
+            "per_talker_ms": elapsed / talkers * 1000,
+            "saved": len(list((workdir / "user_progress").glob("*.json"))),
+            "generations": generations.replace("LLM generations: ", "")
+        }
+
+def main():
+    args, extra_args = parse_args()
+    config = MockConfig(args.latency, args.malformed_rate, args.eval_tokens, args.seed)
+    server = start_server(config)
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Mock Ollama at {host}, analysis args: {' '.join(extra_args) or '(defaults)'}")
+
+    try:
+        print(f"\n{'talkers':>8} {'seconds':>9} {'ms/talker':>10} {'saved':>6}  generations")
+        for talkers in args.sizes:
+            row = run_size(talkers, args, extra_args, host)
+            print(f"{row['talkers']:>8} {row['seconds']:>9.2f} {row['per_talker_ms']:>10.1f} "
+                  f"{row['saved']:>6}  {row['generations']}")
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmark_db.py
+# Latency of per-call connections vs. the pooled WAL connections in database.get_connection
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import auth
+import database
+from auth import hash_password, login_user, check_user_exists, bulk_import_mappings
+from database import close_connection
+
+def legacy_connection():
+    """The previous auth.get_connection: a new rollback-journal connection per call"""
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def seed_users(users: int):
+    with auth.get_connection() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, password_hash, role, group_name) VALUES (?, ?, 'member', 'bench')",
+            [(f"wxid_bench{i:05d}", hash_password("pw")) for i in range(users)]
+        )
+
+def bench_login(users: int) -> float:
+    started = time.perf_counter()
+    for i in range(users):
+        assert login_user(f"wxid_bench{i:05d}", "pw")
+    return (time.perf_counter() - started) / users * 1000
+
+def bench_mapping_import(users: int) -> float:
+    """The per-ID loop of enhanced_process_mapping in automatic mode"""
+    started = time.perf_counter()
+    with auth.get_connection() as conn:
+        for i in range(users):
+            original_id = f"wxid_bench{i:05d}"
+            if not check_user_exists(original_id):
+                continue
+            conn.execute('''
+                INSERT INTO id_mappings (original_id, system_id, group_name)
+                VALUES (?, ?, 'bench')
+                ON CONFLICT(original_id, group_name)
+                DO UPDATE SET system_id = excluded.system_id
+            ''', (original_id, original_id))
+    return (time.perf_counter() - started) / users * 1000
+
+def bench_bulk_import(users: int) -> float:
+    """bulk_import_mappings for the whole file at once, total milliseconds"""
+    pairs = [(f"wxid_bench{i:05d}", f"wxid_bench{i:05d}") for i in range(users)]
+    started = time.perf_counter()
+    report = bulk_import_mappings('bench', pairs)
+    assert len(report["accepted"]) == users
+    return (time.perf_counter() - started) * 1000
+
+def bench_concurrent_reads(seconds: float) -> dict:
+    """Reader latency on analysis_results while another thread keeps committing results"""
+    stop = threading.Event()
+
+    def writer():
+        n = 0
+        while not stop.is_set():
+            with auth.get_connection() as conn:
+                for _ in range(50):
+                    conn.execute('''INSERT INTO analysis_results (talker, timestamp, group_name, scores, analysis)
+                                    VALUES ('wxid_bench00000', datetime('now'), 'bench', '{}', '{}')''')
+                    n += 1
+        close_connection()
+
+    latencies, errors = [], 0
+    thread = threading.Thread(target=writer)
+    thread.start()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with auth.get_connection() as conn:
+                conn.execute("SELECT COUNT(*) FROM analysis_results WHERE talker = 'wxid_bench00000'").fetchone()
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            errors += 1
+    stop.set()
+    thread.join()
+    latencies.sort()
+    return {
+        "reads": len(latencies),
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "max": latencies[-1] if latencies else 0.0,
+        "errors": errors
+    }
+
+def run(label: str, connect, users: int, seconds: float):
+    # Both modules bind the entry point; init_db must not switch the legacy file to WAL
+    auth.get_connection = database.get_connection = connect
+    close_connection()
+    database.DB_PATH = Path(f"user_inform/{label}.db")
+    database.DB_PATH.parent.mkdir(exist_ok=True)
+    database.init_db()
+    seed_users(users)
+    login_ms = bench_login(users)
+    mapping_ms = bench_mapping_import(users)
+    bulk_ms = bench_bulk_import(users)
+    reads = bench_concurrent_reads(seconds)
+    # Write the export bulk_import_mappings scheduled now, while DB_PATH still points into the temp directory
+    auth.flush_mapping_export()
+    print(f"{label:<8} {login_ms:>9.3f} {mapping_ms:>11.3f} {mapping_ms * users:>9.1f} {bulk_ms:>8.1f} {reads['reads']:>8} "
+          f"{reads['p50']:>8.3f} {reads['max']:>8.1f} {reads['errors']:>7}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='SQLite connection benchmark (runs in a temporary directory)')
+    parser.add_argument('--users', type=int, default=2000, help='Users to log in and map (default: 2000)')
+    parser.add_argument('--seconds', type=float, default=3.0,
+                        help='Duration of the concurrent read/write phase (default: 3)')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    pooled = database.get_connection
+    with tempfile.TemporaryDirectory(prefix="bench_db_") as workdir:
+        os.chdir(workdir)
+        print(f"{'mode':<8} {'login ms':>9} {'mapping ms':>11} {'loop ms':>9} {'bulk ms':>8} {'reads':>8} "
+              f"{'read p50':>8} {'read max':>8} {'errors':>7}")
+        run("legacy", legacy_connection, args.users, args.seconds)
+        run("pooled", pooled, args.users, args.seconds)
+        close_connection()
+        os.chdir(Path(__file__).resolve().parent)
@@ -0,0 +1,63 @@
+# benchmark_dtypes.py
+# Memory and groupby cost of talker/type_name as object strings vs. categoricals
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from chat_io import CATEGORICAL_COLUMNS, as_categorical
+
+TYPES = ['文本', '文件', '引用回复', '图片']
+
+def build_export(rows: int, talkers: int, seed: int = 0) -> pd.DataFrame:
+    """A cleaned chat with the preprocess_form column layout, string columns only"""
+    rng = random.Random(seed)
+    names = [f"wxid_{rng.getrandbits(48):012x}22" for _ in range(talkers)]
+    start = pd.Timestamp(2025, 3, 1, 9)
+    return pd.DataFrame({
+        "CreateTime": start + pd.to_timedelta(range(rows), unit='s'),
+        "talker": pd.Series([rng.choice(names) for _ in range(rows)], dtype=object),
+        "type_name": pd.Series([TYPES[0] if rng.random() < 0.8 else rng.choice(TYPES) for _ in range(rows)],
+                               dtype=object),
+        "msg": pd.Series([f"message {i}" for i in range(rows)], dtype=object)
+    })
+
+def column_mb(df: pd.DataFrame) -> float:
+    return df[CATEGORICAL_COLUMNS].memory_usage(deep=True, index=False).sum() / 1024 ** 2
+
+def group_text_messages(df: pd.DataFrame) -> int:
+    """The filter + groupby step of analysis_form.load_chat_data"""
+    df = df[df['type_name'] == '文本']
+    return len(df.groupby('talker', observed=True).indices)
+
+def timed(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Categorical dtype benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000],
+                        help='Row counts to benchmark (default: 100000 1000000)')
+    parser.add_argument('--talkers', type=int, default=500, help='Distinct talkers (default: 500)')
+    parser.add_argument('--repeat', type=int, default=3, help='Best of N timings (default: 3)')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"{'rows':>10} {'object MB':>10} {'categ MB':>9} {'memory':>7} "
+          f"{'object (s)':>11} {'categ (s)':>10} {'speedup':>8}")
+    for n in args.sizes:
+        plain = build_export(n, args.talkers)
+        encoded = as_categorical(plain.copy())
+        assert group_text_messages(plain) == group_text_messages(encoded)
+
+        plain_mb, encoded_mb = column_mb(plain), column_mb(encoded)
+        plain_s = timed(lambda: group_text_messages(plain), args.repeat)
+        encoded_s = timed(lambda: group_text_messages(encoded), args.repeat)
+        print(f"{n:>10} {plain_mb:>10.1f} {encoded_mb:>9.1f} {plain_mb / encoded_mb:>6.1f}x "
+              f"{plain_s:>11.3f} {encoded_s:>10.3f} {plain_s / encoded_s:>7.2f}x")
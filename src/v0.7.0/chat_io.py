@@ -0,0 +1,164 @@
+# chat_io.py
+# Read/write cleaned chat files as xlsx, Parquet or Feather, detected by suffix
+from pathlib import Path
+
+import pandas as pd
+
+CHAT_FORMATS = {
+    ".xlsx": "xlsx",
+    ".parquet": "parquet",
+    ".feather": "feather",
+}
+# Low-cardinality columns carried as categoricals (dictionary-encoded on disk)
+CATEGORICAL_COLUMNS = ['talker', 'type_name']
+CHAT_FILETYPES = [
+    ("Chat Files", "*.parquet *.feather *.xlsx"),
+    ("Parquet Files", "*.parquet"),
+    ("Feather Files", "*.feather"),
+    ("Excel Files", "*.xlsx"),
+]
+
+def detect_format(path) -> str:
+    """Format name for a chat file path, xlsx for unknown suffixes"""
+    return CHAT_FORMATS.get(Path(path).suffix.lower(), "xlsx")
+
+def with_format(path, fmt: str) -> Path:
+    """Replace the suffix of path to match fmt"""
+    return Path(path).with_suffix(f".{fmt}")
+
+def list_chat_files(directory) -> list:
+    """Cleaned chat files of any supported format, skipping Excel lock files"""
+    return sorted(
+        f for f in Path(directory).iterdir()
+        if f.is_file() and f.suffix.lower() in CHAT_FORMATS and not f.name.startswith('~$')
+    )
+
+def as_categorical(df: pd.DataFrame) -> pd.DataFrame:
+    """Encode CATEGORICAL_COLUMNS as categoricals with sorted, used-only categories
+
+    Sorted categories keep groupby order identical to grouping the plain strings.
+    """
+    for col in CATEGORICAL_COLUMNS:
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            df[col] = values.astype('category')
+            continue
+        values = values.cat.remove_unused_categories()
+        try:
+            if not values.cat.categories.is_monotonic_increasing:
+                values = values.cat.reorder_categories(values.cat.categories.sort_values())
+        except TypeError:
+            pass  # Mixed-type categories cannot be ordered
+        df[col] = values
+    return df
+
+def chat_file_columns(path) -> list:
+    """Column names of a cleaned chat file, read from the schema or header row only"""
+    fmt = detect_format(path)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.read_schema(path).names
+    if fmt == "feather":
+        import pyarrow as pa
+        with pa.memory_map(str(path)) as source:
+            return pa.ipc.open_file(source).schema.names
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        header = next(wb["Sheet1"].iter_rows(max_row=1, values_only=True), ())
+        return [str(h) for h in header if h is not None]
+    finally:
+        wb.close()
+
+def read_chat_file(path, columns=None) -> pd.DataFrame:
+    """Load a cleaned chat file in whichever format it was written"""
+    fmt = detect_format(path)
+    if fmt == "parquet":
+        df = pd.read_parquet(path, columns=columns)
+    elif fmt == "feather":
+        df = pd.read_feather(path, columns=columns)
+    else:
+        df = pd.read_excel(path, sheet_name="Sheet1", engine='openpyxl')
+        df = df[columns] if columns else df
+    return as_categorical(df)
+
+def write_chat_file(df: pd.DataFrame, path):
+    """Write a cleaned chat DataFrame in the format given by the path suffix"""
+    fmt = detect_format(path)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    elif fmt == "feather":
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_excel(path, index=False, engine='openpyxl')
+
+class ColumnarBatchWriter:
+    """Incremental Parquet/Feather writer fed one DataFrame batch at a time"""
+    def __init__(self, path, columns):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa = pa
+        self.pq = pq
+        self.path = str(path)
+        self.fmt = detect_format(path)
+        self.columns = list(columns)
+        self.schema = None
+        self.writer = None
+        self.sink = None
+
+    def write(self, df: pd.DataFrame):
+        if df.empty:
+            # An empty batch infers null types, which would fix a schema later batches can't cast to
+            return
+        table = self.pa.Table.from_pandas(df, preserve_index=False)
+        if self.writer is None:
+            self.schema = self._batch_schema(table.schema)
+            table = table.cast(self.schema)
+            if self.fmt == "parquet":
+                self.writer = self.pq.ParquetWriter(self.path, self.schema)
+            else:
+                self.sink = self.pa.OSFile(self.path, "wb")
+                self.writer = self.pa.ipc.new_file(self.sink, self.schema)
+        else:
+            # Later batches may infer a narrower type (e.g. all-null columns)
+            table = table.cast(self.schema)
+        self.writer.write_table(table)
+
+    def _batch_schema(self, schema):
+        """Schema shared by all batches, each of which has its own category dictionary
+
+        Parquet stores a dictionary per row group, so only the index type is
+        widened. Feather (Arrow IPC file) allows a single dictionary per
+        column, so categoricals are written as plain strings there and
+        re-encoded by read_chat_file.
+        """
+        fields = []
+        for field in schema:
+            if self.pa.types.is_dictionary(field.type):
+                if self.fmt == "parquet":
+                    field = field.with_type(self.pa.dictionary(self.pa.int32(), field.type.value_type))
+                else:
+                    field = field.with_type(field.type.value_type)
+            fields.append(field)
+        return self.pa.schema(fields, metadata=schema.metadata)
+
+    def close(self):
+        if self.writer is None:
+            # No rows at all: still leave a readable, empty file behind
+            write_chat_file(pd.DataFrame(columns=self.columns), self.path)
+            return
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+
+    def abort(self):
+        """Close without finalizing and delete the partial file"""
+        try:
+            if self.writer is not None:
+                self.writer.close()
+            if self.sink is not None:
+                self.sink.close()
+        finally:
+            Path(self.path).unlink(missing_ok=True)
@@ -0,0 +1,179 @@
+# chat_log.py
+# Append-only compressed chat log with a background writer, plus a small query tool
+import argparse
+import atexit
+import gzip
+import hashlib
+import json
+import queue
+import threading
+from datetime import datetime
+from pathlib import Path
+
+LOG_DIR = Path("chat_logs")
+PROMPT_FILE = "prompts.jsonl"
+SEGMENT_PATTERN = "segment_*.jsonl.gz"
+SEGMENT_BYTES = 32 * 1024 * 1024  # Rotate after this many uncompressed bytes
+
+class ChatLogWriter:
+    """Buffers log records in a queue and appends them to gzip segments from one thread
+
+    System prompts are stored once in prompts.jsonl and referenced by hash
+    from each record, so a record only carries the talker context and reply.
+    """
+    def __init__(self, log_dir: Path = LOG_DIR, segment_bytes: int = SEGMENT_BYTES):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.queue = queue.Queue()
+        self.known_prompts = set(load_prompts(self.log_dir))
+        self.segment = None
+        self.segment_size = 0
+        self.thread = threading.Thread(target=self._run, name="chat-log-writer", daemon=True)
+        self.thread.start()
+
+    def append(self, record: dict):
+        """Queue one record; returns immediately"""
+        self.queue.put(record)
+
+    def close(self):
+        """Flush pending records and close the open segment"""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            # Drain whatever else is waiting so one write covers many records
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write_batch([r for r in batch if r is not None])
+            except Exception as e:
+                print(f"日志写入失败: {str(e)}")
+            if stop:
+                if self.segment:
+                    self.segment.close()
+                return
+
+    def _write_batch(self, records: list):
+        if not records:
+            return
+        lines = []
+        for record in records:
+            lines.append(json.dumps(self._dedupe_prompt(record),
+                                    ensure_ascii=False, separators=(',', ':')))
+        data = ("\n".join(lines) + "\n").encode('utf-8')
+
+        if self.segment is None or self.segment_size + len(data) > self.segment_bytes:
+            self._rotate()
+        self.segment.write(data)
+        self.segment.flush()
+        self.segment_size += len(data)
+
+    def _rotate(self):
+        if self.segment:
+            self.segment.close()
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        self.segment = gzip.open(self.log_dir / f"segment_{stamp}.jsonl.gz", "ab")
+        self.segment_size = 0
+
+    def _dedupe_prompt(self, record: dict) -> dict:
+        messages = record.get("request", {}).get("messages", [])
+        if not messages or messages[0].get("role") != "system":
+            return record
+        prompt = messages[0]["content"]
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        if prompt_hash not in self.known_prompts:
+            with open(self.log_dir / PROMPT_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"hash": prompt_hash, "prompt": prompt}, ensure_ascii=False) + "\n")
+            self.known_prompts.add(prompt_hash)
+        request = {
+            **record["request"],
+            "messages": [{"role": "system", "prompt_hash": prompt_hash}, *messages[1:]]
+        }
+        return {**record, "request": request}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_log_writer() -> ChatLogWriter:
+    """Process-wide writer, started on first use and flushed at exit"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ChatLogWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+def load_prompts(log_dir: Path = LOG_DIR) -> dict:
+    """Map prompt hash -> system prompt text"""
+    prompts = {}
+    path = Path(log_dir) / PROMPT_FILE
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    prompts[entry["hash"]] = entry["prompt"]
+    return prompts
+
+def read_logs(log_dir: Path = LOG_DIR, talker: str = None, since: str = None,
+              until: str = None, with_prompt: bool = False):
+    """Yield records from all segments in write order, optionally filtered
+
+    `since`/`until` are ISO timestamps compared with the record timestamp.
+    With `with_prompt` the system prompt text is restored from its hash.
+    """
+    prompts = load_prompts(log_dir) if with_prompt else {}
+    for segment in sorted(Path(log_dir).glob(SEGMENT_PATTERN)):
+        try:
+            with gzip.open(segment, "rt", encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if talker and record.get("talker") != talker:
+                        continue
+                    if since and record.get("timestamp", "") < since:
+                        continue
+                    if until and record.get("timestamp", "") > until:
+                        continue
+                    if with_prompt:
+                        for message in record.get("request", {}).get("messages", []):
+                            if "prompt_hash" in message:
+                                message["content"] = prompts.get(message["prompt_hash"], "")
+                    yield record
+        except (EOFError, gzip.BadGzipFile):
+            # The segment still being written may end mid-member
+            continue
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Query the compressed chat logs')
+    parser.add_argument('--dir', default=str(LOG_DIR), help='Log directory (default: chat_logs)')
+    parser.add_argument('--talker', help='Only records of this talker')
+    parser.add_argument('--since', help='ISO timestamp lower bound')
+    parser.add_argument('--until', help='ISO timestamp upper bound')
+    parser.add_argument('--errors', action='store_true', help='Only records with an error')
+    parser.add_argument('--limit', type=int, default=20, help='Maximum records to print (default: 20)')
+    parser.add_argument('--full', action='store_true', help='Print whole records including the prompt')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    shown = 0
+    for record in read_logs(Path(args.dir), args.talker, args.since, args.until, with_prompt=args.full):
+        if args.errors and not record.get("error"):
+            continue
+        if args.full:
+            print(json.dumps(record, ensure_ascii=False, indent=2))
+        else:
+            reply = record.get("response", "").replace("\n", " ")
+            print(f"{record.get('timestamp')}  {record.get('talker')}  attempt {record.get('attempt')}  "
+                  f"{record.get('error') or reply[:80]}")
+        shown += 1
+        if shown >= args.limit:
+            break
@@ -1,44 +1,186 @@
 # database.py
 import sqlite3
+import json
+import threading
 from pathlib import Path
 import sys
 
 # 统一数据库路径为 user_inform/system.db
 DB_PATH = Path("user_inform") / "system.db"  # 修改路径
 
-def init_db():
-    """初始化数据库表结构（包含 id_mappings 表）"""
-    try:
-        Path("user_inform").mkdir(exist_ok=True)
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
+# 连接池参数：每个线程复用一个长连接
+BUSY_TIMEOUT = 30          # 秒，写锁被占用时的等待上限
+CACHE_SIZE_KB = 16 * 1024  # 每个连接的页缓存
+STATEMENT_CACHE = 256      # 每个连接缓存的预编译语句数
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",     # 读写互不阻塞：分析写入时界面仍可查询
+    "PRAGMA synchronous = NORMAL",   # WAL 下只在检查点同步，断电最多丢失最后的事务
+    f"PRAGMA cache_size = -{CACHE_SIZE_KB}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+]
 
-        # 用户表
-        c.execute('''CREATE TABLE IF NOT EXISTS users
-                    (username TEXT PRIMARY KEY,
-                    password_hash TEXT NOT NULL,
-                    role TEXT CHECK(role IN ('leader', 'member')) NOT NULL,
-                    group_name TEXT DEFAULT '')''')
+_local = threading.local()
 
-        # 群组表
-        c.execute('''CREATE TABLE IF NOT EXISTS groups
-                    (group_name TEXT PRIMARY KEY,
-                    creator TEXT NOT NULL,
-                    FOREIGN KEY(creator) REFERENCES users(username))''')
-
-        # ID映射表（修正字段名和约束）
-        c.execute('''CREATE TABLE IF NOT EXISTS id_mappings
-                    (original_id TEXT NOT NULL,
-                    system_id TEXT NOT NULL,
-                    group_name TEXT NOT NULL,
-                    PRIMARY KEY (original_id, group_name),
-                    FOREIGN KEY(system_id) REFERENCES users(username))''')  # 添加外键约束
-
-        conn.commit()
+def get_connection() -> sqlite3.Connection:
+    """当前线程的数据库连接，首次调用时打开并设置 PRAGMA，之后复用
+
+    用法不变：`with get_connection() as conn:` 在退出时提交或回滚，但不关闭连接。
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        DB_PATH.parent.mkdir(exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, cached_statements=STATEMENT_CACHE)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        _local.conn = conn
+    return conn
+
+def close_connection():
+    """关闭当前线程的连接（线程结束时也会随之释放）"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
         conn.close()
+        _local.conn = None
+
+# 按顺序执行的结构迁移，PRAGMA user_version 记录已执行到第几个。
+# 只能在末尾追加新迁移，已发布的迁移不可修改。
+MIGRATIONS = [
+    # 1: 基础表结构（CREATE ... IF NOT EXISTS，兼容迁移引擎之前创建的数据库）
+    [
+        # 用户表
+        '''CREATE TABLE IF NOT EXISTS users
+            (username TEXT PRIMARY KEY,
+            password_hash TEXT NOT NULL,
+            role TEXT CHECK(role IN ('leader', 'member')) NOT NULL,
+            group_name TEXT DEFAULT '')''',
+        # 群组表
+        '''CREATE TABLE IF NOT EXISTS groups
+            (group_name TEXT PRIMARY KEY,
+            creator TEXT NOT NULL,
+            FOREIGN KEY(creator) REFERENCES users(username))''',
+        # ID映射表
+        '''CREATE TABLE IF NOT EXISTS id_mappings
+            (original_id TEXT NOT NULL,
+            system_id TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            PRIMARY KEY (original_id, group_name),
+            FOREIGN KEY(system_id) REFERENCES users(username))''',
+        # 增量分析水位线表（每个成员最后一次分析到的 CreateTime 及累计得分）
+        '''CREATE TABLE IF NOT EXISTS analysis_watermarks
+            (talker TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            last_create_time TEXT NOT NULL,
+            scores TEXT NOT NULL,
+            message_weight REAL NOT NULL,
+            analyzed_at TEXT NOT NULL,
+            PRIMARY KEY (talker, group_name))''',
+        # 分析结果表（替代 user_progress 下的逐文件 JSON）
+        '''CREATE TABLE IF NOT EXISTS analysis_results
+            (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            talker TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            group_name TEXT NOT NULL DEFAULT '',
+            schema_version TEXT,
+            scores TEXT NOT NULL,
+            analysis TEXT NOT NULL,
+            source_file TEXT UNIQUE)''',
+        '''CREATE INDEX IF NOT EXISTS idx_analysis_results_talker_time
+            ON analysis_results (talker, timestamp)''',
+        '''CREATE INDEX IF NOT EXISTS idx_analysis_results_group
+            ON analysis_results (group_name)''',
+    ],
+    # 2: 报告页按系统ID查映射（_load_history_data）
+    [
+        "CREATE INDEX IF NOT EXISTS idx_id_mappings_system ON id_mappings (system_id)",
+    ],
+    # 3: 群组成员列表（load_group_members）
+    [
+        "CREATE INDEX IF NOT EXISTS idx_users_group ON users (group_name)",
+    ],
+]
+
+_current_paths = set()  # 本进程内已确认为最新结构的数据库文件
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn) -> int:
+    """执行尚未应用的迁移，返回本次执行的数量
+
+    每个迁移与 user_version 的更新在同一个 BEGIN IMMEDIATE 事务中完成，
+    事务内重新读取版本号，多个进程同时启动时每个迁移也只会执行一次。
+    """
+    applied = 0
+    while schema_version(conn) < len(MIGRATIONS):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            if version < len(MIGRATIONS):
+                for statement in MIGRATIONS[version]:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                applied += 1
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
+
+def init_db():
+    """初始化或升级数据库结构；结构已是最新时不执行任何 DDL"""
+    if DB_PATH in _current_paths:
+        return
+    try:
+        applied = migrate(get_connection())
+        if applied:
+            print(f"数据库结构已升级到版本 {len(MIGRATIONS)}（执行 {applied} 个迁移）")
+        _current_paths.add(DB_PATH)
     except Exception as e:
         print(f"数据库初始化失败: {str(e)}")
         sys.exit(1)
 
+def insert_analysis_result(conn, record: dict, source_file: str = None, skip_existing: bool = False):
+    """写入一条分析结果（record 与 user_progress 下 JSON 文件结构一致）
+
+    source_file 唯一；只有迁移旧文件时才用 skip_existing 忽略已入库的文件，
+    实时写入遇到重复会抛出 IntegrityError 而不是静默丢弃。
+    """
+    analysis = record.get("analysis", {})
+    conn.execute(f'''
+        INSERT {"OR IGNORE " if skip_existing else ""}INTO analysis_results
+        (talker, timestamp, group_name, schema_version, scores, analysis, source_file)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (record["talker"], record["timestamp"], record.get("group", ""),
+          record.get("schema_version"),
+          json.dumps(analysis.get("scores", {})),
+          json.dumps(analysis, ensure_ascii=False),
+          source_file))
+
+def import_progress_files(progress_dir: Path = Path("user_progress")) -> int:
+    """把尚未入库的 user_progress/*.json 迁移到 analysis_results 表"""
+    progress_dir = Path(progress_dir)
+    if not progress_dir.exists():
+        return 0
+    imported = 0
+    try:
+        with get_connection() as conn:
+            known = {row[0] for row in conn.execute(
+                "SELECT source_file FROM analysis_results WHERE source_file IS NOT NULL")}
+            for file in progress_dir.glob("*.json"):
+                if file.name in known:
+                    continue
+                try:
+                    with open(file, 'r', encoding='utf-8') as f:
+                        insert_analysis_result(conn, json.load(f), file.name, skip_existing=True)
+                    imported += 1
+                except (ValueError, KeyError) as e:
+                    print(f"跳过无效结果文件 {file.name}: {str(e)}")
+    except sqlite3.Error as e:
+        print(f"结果迁移失败: {str(e)}")
+    return imported
+
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    init_db()
+    print(f"数据库结构版本: {schema_version(get_connection())}/{len(MIGRATIONS)}")
+    print(f"已迁移 {import_progress_files()} 个分析结果文件")
\ No newline at end of file
@@ -1,20 +1,22 @@
 # home_ui.py
 import tkinter as tk
 from tkinter import ttk, messagebox
-from auth import login_user, get_connection
-from database import init_db
+from auth import login_user, get_connection, mark_mappings_changed, export_mapping_file, MAPPING_EXPORT_PATH
+from database import init_db, import_progress_files
+from chat_io import CHAT_FILETYPES
+from preprocess_form import preprocess, run_batch
+from analysis_form import run_analysis as analyze_file
 from pathlib import Path
-import subprocess
 import matplotlib.pyplot as plt
 from tkinter import filedialog
-import sys
 import os
+import queue
+import threading
 import matplotlib.dates as mdates
 from datetime import datetime
 from collections import defaultdict
 import numpy as np
 import json
-import pandas as pd
 from math import pi
 
 os.environ["PYTHONIOENCODING"] = "utf-8" 
@@ -25,7 +27,11 @@ class HomePage:
         self.root.title("Collaboration Analysis System")
         self.root.geometry("1200x800")
         self.current_user = None
+        # 后台任务（预处理/分析）的事件队列，由 Tk 主线程轮询
+        self.task_events = queue.Queue()
+        self.task_running = False
         init_db()
+        import_progress_files()
         self.setup_style()
         self.show_login()
 
@@ -206,23 +212,73 @@ class HomePage:
         self.output_file_entry = ttk.Entry(preprocess_frame, width=40)
         self.output_file_entry.grid(row=1, column=1, pady=10)
         
+        ttk.Label(preprocess_frame, text="Output Format:").grid(row=2, column=0, sticky=tk.W)
+        self.output_format = ttk.Combobox(preprocess_frame,
+                                          values=["parquet", "feather", "xlsx"],
+                                          state="readonly",
+                                          width=10)
+        self.output_format.set("parquet")
+        self.output_format.grid(row=2, column=1, sticky=tk.W)
+        
         process_btn = ttk.Button(preprocess_frame, 
                                 text="Start Processing", 
                                 command=self.run_preprocessing)
-        process_btn.grid(row=2, columnspan=3, pady=20)
+        process_btn.grid(row=3, column=0, columnspan=2, pady=20)
+
+        ttk.Button(preprocess_frame,
+                   text="Process All in input_form",
+                   command=self.run_batch_preprocessing).grid(row=3, column=2, pady=20)
         
         self.preprocess_status = ttk.Label(preprocess_frame, text="")
-        self.preprocess_status.grid(row=3, columnspan=3)
+        self.preprocess_status.grid(row=4, columnspan=3)
 
     def select_raw_file(self):
         file_path = filedialog.askopenfilename(
             title="Select Raw Chat File",
-            filetypes=[("Excel Files", "*.xlsx"), ("All Files", "*.*")]
+            filetypes=[("Chat Exports", "*.xlsx *.csv *.jsonl *.ndjson"),
+                       ("Excel Files", "*.xlsx"),
+                       ("CSV Files", "*.csv"),
+                       ("JSON Lines", "*.jsonl *.ndjson"),
+                       ("All Files", "*.*")]
         )
         if file_path:
             self.raw_file_entry.delete(0, tk.END)
             self.raw_file_entry.insert(0, file_path)
 
+    def start_task(self, work, on_progress, on_done, on_error):
+        """在后台线程中运行 work(progress)，回调均在 Tk 主线程执行"""
+        if self.task_running:
+            messagebox.showinfo("Busy", "Another task is still running")
+            return False
+        self.task_running = True
+
+        def runner():
+            try:
+                result = work(lambda *args: self.task_events.put((on_progress, args, False)))
+                self.task_events.put((on_done, (result,), True))
+            except BaseException as e:
+                # 包括库代码中的 sys.exit（如 init_db 失败），否则 task_running 不会复位
+                self.task_events.put((on_error, (e,), True))
+
+        threading.Thread(target=runner, daemon=True).start()
+        self.root.after(100, self._poll_task)
+        return True
+
+    def _poll_task(self):
+        while True:
+            try:
+                callback, args, finished = self.task_events.get_nowait()
+            except queue.Empty:
+                break
+            if finished:
+                self.task_running = False
+            try:
+                callback(*args)
+            except tk.TclError:
+                pass  # 任务期间切换了页面，原控件已销毁
+        if self.task_running:
+            self.root.after(100, self._poll_task)
+
     def run_preprocessing(self):
         raw_path = self.raw_file_entry.get()
         output_name = self.output_file_entry.get()
@@ -231,36 +287,64 @@ class HomePage:
             messagebox.showerror("Error", "Both fields are required")
             return
         
-        try:
-            cmd = [
-                sys.executable, "preprocess_form.py",
-                raw_path,
-                os.path.join("output_form", f"{output_name}.xlsx")
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,          # 启用文本模式
-                encoding='utf-8',   # 明确指定编码
-                errors='replace'    # 替换无效字符
+        output_path = os.path.join("output_form", f"{output_name}.{self.output_format.get()}")
+
+        def on_progress(stats):
+            self.preprocess_status.config(
+                text=f"Processing... {stats['rows_in']} rows read, {stats['kept']} kept",
+                foreground="black"
             )
-            
-            output = result.stdout + result.stderr
+
+        def on_done(result):
+            stats = result["stats"]
+            if result["cached"]:
+                text = f"Input unchanged, {stats['kept']} records already in {result['output']}"
+            else:
+                text = (f"Processing completed:\nSuccessfully processed {stats['kept']} records "
+                        f"in {result['seconds']:.2f}s\nOutput file saved to: {result['output']}")
+            self.preprocess_status.config(text=text, foreground="green")
+
+        def on_error(e):
+            self.preprocess_status.config(text=f"Error during processing: {str(e)}", foreground="red")
+
+        if self.start_task(lambda progress: preprocess(raw_path, output_path, stream=True, progress=progress),
+                           on_progress, on_done, on_error):
+            self.preprocess_status.config(text="Processing...", foreground="black")
+
+    def run_batch_preprocessing(self):
+        fmt = self.output_format.get()
+
+        def on_progress(done, total, result):
             self.preprocess_status.config(
-                text=f"Processing completed:\n{output}",
-                foreground="green"
+                text=f"Batch processing... {done}/{total} files ({Path(result['input']).name})",
+                foreground="black"
             )
-            
-        except subprocess.CalledProcessError as e:
-            error_msg = f"STDOUT:\n{e.stdout}\nSTDERR:\n{e.stderr}"
+
+        def on_done(results):
+            if not results:
+                self.preprocess_status.config(text="No input files found in input_form", foreground="red")
+                return
+            lines = []
+            for r in results:
+                name = Path(r["input"]).name
+                if r["error"]:
+                    lines.append(f"{name}: FAILED {r['error']}")
+                else:
+                    lines.append(f"{name}: {r['stats']['kept']} records"
+                                 f"{' (cached)' if r.get('cached') else ''}")
+            failed = any(r["error"] for r in results)
             self.preprocess_status.config(
-                text=error_msg,
-                foreground="red"
+                text="Batch processing completed:\n" + "\n".join(lines),
+                foreground="red" if failed else "green"
             )
 
+        def on_error(e):
+            self.preprocess_status.config(text=f"Batch processing failed: {str(e)}", foreground="red")
+
+        if self.start_task(lambda progress: run_batch(fmt=fmt, progress=progress, verbose=False),
+                           on_progress, on_done, on_error):
+            self.preprocess_status.config(text="Batch processing...", foreground="black")
+
     def show_analysis(self):
         for widget in self.content_area.winfo_children():
             widget.destroy()
@@ -280,7 +364,7 @@ class HomePage:
                   text="Start Analysis",
                   command=self.run_analysis).grid(row=1, columnspan=3, pady=20)
         
-        self.progress = ttk.Progressbar(analysis_frame, orient=tk.HORIZONTAL, mode='indeterminate')
+        self.progress = ttk.Progressbar(analysis_frame, orient=tk.HORIZONTAL, mode='determinate')
         self.progress.grid(row=2, columnspan=3, sticky=tk.EW)
         
         self.analysis_result = ttk.Label(analysis_frame, text="")
@@ -290,7 +374,7 @@ class HomePage:
         file_path = filedialog.askopenfilename(
             initialdir="output_form",
             title="Select Preprocessed File",
-            filetypes=[("Excel Files", "*.xlsx")]
+            filetypes=CHAT_FILETYPES
         )
         if file_path:
             self.processed_file_entry.delete(0, tk.END)
@@ -301,34 +385,29 @@ class HomePage:
         if not input_file:
             messagebox.showerror("Error", "Please select a file first")
             return
-        
-        self.progress.start()
-        try:
-            cmd = [sys.executable, "analysis_form.py", "--input", input_file]
-            result = subprocess.run(
-                cmd, 
-                capture_output=True,
-                text=True,  # 启用文本模式
-                encoding='utf-8',  # 新增编码指定
-                errors='replace',  # 替换无法解码的字符
-                check=True
-            )
-            
-            # 增强输出处理
-            output = f"STDOUT:\n{result.stdout}\n\nSTDERR:\n{result.stderr}"
-            self.analysis_result.config(
-                text=f"Analysis completed:\n{output}",
-                foreground="green"
-            )
-            
-        except subprocess.CalledProcessError as e:
-            error_msg = f"STDOUT:\n{e.stdout}\nSTDERR:\n{e.stderr}"
-            self.analysis_result.config(
-                text=f"Analysis failed:\n{error_msg}",
-                foreground="red"
-            )
-        finally:
-            self.progress.stop()
+
+        def on_progress(done, total, talker):
+            self.progress.config(maximum=total, value=done)
+            self.analysis_result.config(text=f"Scored {done}/{total}: {talker}", foreground="black")
+
+        def on_done(run):
+            stats = run["stats"]
+            lines = [f"{len(run['results'])} members scored"]
+            if run["skipped"]:
+                lines.append(f"Skipped {run['skipped']} talkers with no new messages")
+            lines.append(f"LLM generations: {stats['generations']} "
+                         f"({stats['retries']} retries, {stats['schema_fallbacks']} schema fallbacks)")
+            if run["cache"] is not None:
+                lines.append(f"LLM cache: {run['cache']['hits']} hits, {run['cache']['misses']} misses")
+            self.analysis_result.config(text="Analysis completed:\n" + "\n".join(lines), foreground="green")
+
+        def on_error(e):
+            self.analysis_result.config(text=f"Analysis failed:\n{str(e)}", foreground="red")
+
+        if self.start_task(lambda progress: analyze_file(input_file, progress=progress),
+                           on_progress, on_done, on_error):
+            self.progress.config(value=0)
+            self.analysis_result.config(text="Analyzing...", foreground="black")
 
     def show_reports(self):
         for widget in self.content_area.winfo_children():
@@ -555,32 +634,30 @@ class HomePage:
         return {k: sum(v)/len(v) for k, v in score_dict.items()}
 
     def _load_history_data(self):
-        user_dir = Path("user_progress")
-        if not user_dir.exists():
-            return []
-            
-        # Get mappinglralation
+        # Query the indexed results table by the user's mapped original IDs.
+        # Results are not filtered by group: their group_name is the input file
+        # prefix (e.g. "cleaned"), which need not match the mapping's group.
         with get_connection() as conn:
-            mappings = pd.read_sql(
-                "SELECT original_id FROM id_mappings WHERE system_id = ?",
-                conn, 
-                params=(self.current_user['username'],)
-            ).original_id.tolist()
-            
-        # Traverse all relevant files
+            rows = conn.execute('''
+                SELECT timestamp, scores
+                FROM analysis_results
+                WHERE talker IN (
+                    SELECT original_id FROM id_mappings WHERE system_id = ?
+                )
+                ORDER BY timestamp
+            ''', (self.current_user['username'],)).fetchall()
+
         timeline = []
-        for file in user_dir.glob("*.json"):
+        for timestamp, scores_json in rows:
             try:
-                with open(file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    if data.get('original_id') in mappings:
-                        timeline.append({
-                            'date': datetime.fromisoformat(data['timestamp']).strftime('%Y-%m'),
-                            'scores': data['analysis'].get('scores', {}),
-                            'average': sum(data['analysis'].get('scores', {}).values())/5
-                        })
+                scores = json.loads(scores_json)
+                timeline.append({
+                    'date': datetime.fromisoformat(timestamp).strftime('%Y-%m'),
+                    'scores': scores,
+                    'average': sum(scores.values())/5
+                })
             except Exception as e:
-                print(f"加载文件 {file.name} 失败: {str(e)}")
+                print(f"加载分析记录 {timestamp} 失败: {str(e)}")
 
         return sorted(timeline, key=lambda x: x['date'])
 
@@ -693,6 +770,7 @@ class HomePage:
         ttk.Button(control_frame, text="刷新", command=self.load_mappings).pack(side=tk.LEFT, padx=2)
         ttk.Button(control_frame, text="添加映射", command=self.add_mapping).pack(side=tk.LEFT, padx=2)
         ttk.Button(control_frame, text="删除映射", command=self.delete_mapping).pack(side=tk.LEFT, padx=2)
+        ttk.Button(control_frame, text="立即导出Excel", command=self.export_mappings).pack(side=tk.LEFT, padx=2)
 
         # 映射列表
         columns = ("原始ID", "系统ID", "群组")
@@ -789,7 +867,8 @@ class HomePage:
                         DO UPDATE SET system_id = excluded.system_id
                     ''', (original_id, system_id, group_name))
                     conn.commit()
-                    
+                    mark_mappings_changed()
+
                     messagebox.showinfo("成功", "映射关系已保存")
                     self.load_mappings()
                     add_dialog.destroy()
@@ -821,13 +900,22 @@ class HomePage:
                     WHERE original_id = ? AND group_name = ?
                 ''', (original_id, group_name))
                 conn.commit()
-                
+                mark_mappings_changed()
+
                 self.load_mappings()
                 messagebox.showinfo("成功", "映射已删除")
-                
+
         except sqlite3.Error as e:
             messagebox.showerror("数据库错误", f"删除失败: {str(e)}")
 
+    def export_mappings(self):
+        """按需立即从数据库重新生成 Excel 映射文件"""
+        try:
+            count = export_mapping_file()
+            messagebox.showinfo("导出完成", f"已导出 {count} 条映射到 {MAPPING_EXPORT_PATH}")
+        except Exception as e:
+            messagebox.showerror("导出失败", f"Excel映射文件导出失败: {str(e)}")
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = HomePage(root)
@@ -0,0 +1,147 @@
+# llm_cache.py
+# Disk-backed cache of LLM responses keyed by a prompt fingerprint
+import sqlite3
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+CACHE_PATH = Path("user_inform") / "llm_cache.db"
+MAX_AGE_DAYS = 30
+MAX_ENTRIES = 50000
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "writes": 0}
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_ready_paths = set()  # Cache files whose table already exists in this process
+
+def get_cache_connection() -> sqlite3.Connection:
+    """The current thread's cache connection, opened on first use and then reused
+
+    The table is created once per cache file and process, not on every call.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == CACHE_PATH:
+        return conn
+    close_cache_connection()
+    CACHE_PATH.parent.mkdir(exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    with _schema_lock:
+        if CACHE_PATH not in _ready_paths:
+            with conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS llm_responses
+                                (cache_key TEXT PRIMARY KEY,
+                                model TEXT NOT NULL,
+                                schema_version TEXT NOT NULL,
+                                prompt_hash TEXT NOT NULL,
+                                context_hash TEXT NOT NULL,
+                                temperature REAL NOT NULL,
+                                response TEXT NOT NULL,
+                                created_at REAL NOT NULL,
+                                last_hit REAL NOT NULL)''')
+            _ready_paths.add(CACHE_PATH)
+    _local.conn, _local.path = conn, CACHE_PATH
+    return conn
+
+def close_cache_connection():
+    """Close the current thread's cache connection"""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def make_cache_key(model: str, schema_version: str, system_prompt: str,
+                   context: str, temperature: float, extra: dict = None) -> dict:
+    """Build the fingerprint fields and the combined cache key
+
+    `extra` holds any other request settings that change the reply (output
+    format, generation limits); it only feeds the combined key.
+    """
+    fields = {
+        "model": model,
+        "schema_version": schema_version,
+        "prompt_hash": _sha256(system_prompt),
+        "context_hash": _sha256(context),
+        "temperature": round(float(temperature), 4)
+    }
+    extra = {k: v for k, v in (extra or {}).items() if v is not None}
+    fields["cache_key"] = _sha256(json.dumps({**fields, "extra": extra}, sort_keys=True, default=str))
+    return fields
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+def get_cached_response(key: dict):
+    """Return the cached response text, or None on a miss"""
+    try:
+        with get_cache_connection() as conn:
+            row = conn.execute(
+                "SELECT response FROM llm_responses WHERE cache_key = ?",
+                (key["cache_key"],)
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE llm_responses SET last_hit = ? WHERE cache_key = ?",
+                    (time.time(), key["cache_key"])
+                )
+                _count("hits")
+                return row[0]
+    except sqlite3.Error as e:
+        print(f"Cache lookup failed: {str(e)}")
+    _count("misses")
+    return None
+
+def store_response(key: dict, response: str):
+    """Insert or refresh a cached response"""
+    now = time.time()
+    try:
+        with get_cache_connection() as conn:
+            conn.execute('''
+                INSERT INTO llm_responses
+                (cache_key, model, schema_version, prompt_hash, context_hash,
+                 temperature, response, created_at, last_hit)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key)
+                DO UPDATE SET response = excluded.response,
+                              created_at = excluded.created_at,
+                              last_hit = excluded.last_hit
+            ''', (key["cache_key"], key["model"], key["schema_version"],
+                  key["prompt_hash"], key["context_hash"], key["temperature"],
+                  response, now, now))
+        _count("writes")
+    except sqlite3.Error as e:
+        print(f"Cache write failed: {str(e)}")
+
+def prune_cache(max_age_days: float = MAX_AGE_DAYS, max_entries: int = MAX_ENTRIES) -> int:
+    """Evict entries older than max_age_days, then the least recently hit beyond max_entries"""
+    try:
+        with get_cache_connection() as conn:
+            removed = conn.execute(
+                "DELETE FROM llm_responses WHERE created_at < ?",
+                (time.time() - max_age_days * 86400,)
+            ).rowcount
+            removed += conn.execute('''
+                DELETE FROM llm_responses WHERE cache_key IN (
+                    SELECT cache_key FROM llm_responses
+                    ORDER BY last_hit DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (max_entries,)).rowcount
+            return removed
+    except sqlite3.Error as e:
+        print(f"Cache eviction failed: {str(e)}")
+        return 0
+
+def cache_stats() -> dict:
+    """Hit/miss/write counters for the current process"""
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,201 @@
+# migrate.py
+# 批量导入用户与群组（xlsx / CSV / Parquet），分块读取，每块一个事务
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from auth import hash_password
+from database import init_db, get_connection, DB_PATH
+
+CHUNK_ROWS = 5000
+VALID_ROLES = ('leader', 'member')
+# 旧版 users.xlsx 使用中文角色名
+ROLE_ALIASES = {"组长": "leader", "组员": "member"}
+
+# 目标列 -> 可接受的源列名（按优先级）；旧版 users.xlsx 的 password 列已是 SHA-256 哈希
+USER_COLUMNS = {
+    "username": ["username"],
+    "password_hash": ["password_hash", "password"],
+    "role": ["role"],
+    "group_name": ["group_name", "group"],
+}
+GROUP_COLUMNS = {
+    "group_name": ["group_name", "group"],
+    "creator": ["creator"],
+}
+
+USER_SQL = {
+    "ignore": '''
+        INSERT OR IGNORE INTO users (username, password_hash, role, group_name)
+        VALUES (?, ?, ?, ?)
+    ''',
+    # 只有内容确实变化时才更新，changes() 因而只统计真正写入的行
+    "update": '''
+        INSERT INTO users (username, password_hash, role, group_name)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(username) DO UPDATE SET
+            password_hash = excluded.password_hash,
+            role = excluded.role,
+            group_name = excluded.group_name
+        WHERE password_hash IS NOT excluded.password_hash
+           OR role IS NOT excluded.role
+           OR group_name IS NOT excluded.group_name
+    ''',
+}
+# 创建者必须已注册（外键），不存在时该行不插入并计为跳过
+GROUP_SQL = {
+    "ignore": '''
+        INSERT OR IGNORE INTO groups (group_name, creator)
+        SELECT ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE username = ?)
+    ''',
+    "update": '''
+        INSERT INTO groups (group_name, creator)
+        SELECT ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE username = ?)
+        ON CONFLICT(group_name) DO UPDATE SET creator = excluded.creator
+        WHERE creator IS NOT excluded.creator
+    ''',
+}
+
+def resolve_source_columns(header, columns: dict) -> dict:
+    """目标列 -> 源文件中的实际列名，缺少必需列时抛出 KeyError"""
+    mapping = {}
+    for target, aliases in columns.items():
+        found = next((a for a in aliases if a in header), None)
+        if found is None:
+            raise KeyError(f"Missing column {target} (accepted names: {', '.join(aliases)})")
+        mapping[target] = found
+    return mapping
+
+def _as_text(df: pd.DataFrame) -> pd.DataFrame:
+    return df.astype(object).where(df.notna(), '').astype(str).apply(lambda col: col.str.strip())
+
+def iter_source_chunks(path, columns: dict, chunk_rows: int = CHUNK_ROWS):
+    """按后缀分块读取 xlsx / CSV / Parquet，产出只含目标列的字符串 DataFrame"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == '.csv':
+        reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_rows)
+        mapping = None
+        for chunk in reader:
+            mapping = mapping or resolve_source_columns(list(chunk.columns), columns)
+            yield _as_text(chunk[list(mapping.values())]).set_axis(list(mapping), axis=1)
+    elif suffix == '.parquet':
+        import pyarrow.parquet as pq
+        source = pq.ParquetFile(path)
+        mapping = resolve_source_columns(source.schema_arrow.names, columns)
+        for batch in source.iter_batches(batch_size=chunk_rows, columns=list(dict.fromkeys(mapping.values()))):
+            chunk = batch.to_pandas()
+            yield _as_text(chunk[list(mapping.values())]).set_axis(list(mapping), axis=1)
+    else:
+        # 只读模式逐行读取，内存占用与工作簿大小无关
+        wb = load_workbook(path, read_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            header = [str(h).strip() if h is not None else '' for h in next(rows, [])]
+            mapping = resolve_source_columns(header, columns)
+            positions = [header.index(source) for source in mapping.values()]
+            batch = []
+            for row in rows:
+                batch.append(['' if i >= len(row) or row[i] is None else str(row[i]).strip() for i in positions])
+                if len(batch) >= chunk_rows:
+                    yield pd.DataFrame(batch, columns=list(mapping))
+                    batch = []
+            if batch:
+                yield pd.DataFrame(batch, columns=list(mapping))
+        finally:
+            wb.close()
+
+def load_chunk(conn, sql: str, rows: list) -> int:
+    """一个事务内 executemany，返回 SQLite changes() 统计的写入行数"""
+    before = conn.total_changes
+    with conn:
+        conn.executemany(sql, rows)
+    return conn.total_changes - before
+
+def new_report() -> dict:
+    return {"rows": 0, "written": 0, "skipped": 0, "invalid": 0, "seconds": 0.0}
+
+def migrate_users(path, chunk_rows: int = CHUNK_ROWS, on_conflict: str = "ignore",
+                  hash_passwords: bool = False) -> dict:
+    """导入用户；重复用户名按 on_conflict 忽略（ignore）或更新（update）
+
+    hash_passwords 为 True 时源文件中是明文密码，写入前做 SHA-256。
+    """
+    started = time.perf_counter()
+    report = new_report()
+    conn = get_connection()
+    for chunk in iter_source_chunks(path, USER_COLUMNS, chunk_rows):
+        report["rows"] += len(chunk)
+        chunk = chunk.assign(role=chunk['role'].replace(ROLE_ALIASES))
+        valid = (chunk['username'] != '') & (chunk['password_hash'] != '') & chunk['role'].isin(VALID_ROLES)
+        report["invalid"] += int((~valid).sum())
+        chunk = chunk[valid]
+        if hash_passwords:
+            chunk = chunk.assign(password_hash=chunk['password_hash'].map(hash_password))
+        rows = chunk[list(USER_COLUMNS)].to_numpy(dtype=object).tolist()
+        written = load_chunk(conn, USER_SQL[on_conflict], rows)
+        report["written"] += written
+        report["skipped"] += len(rows) - written
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+def migrate_groups(path, chunk_rows: int = CHUNK_ROWS, on_conflict: str = "ignore") -> dict:
+    """导入群组；创建者未注册的行计为跳过"""
+    started = time.perf_counter()
+    report = new_report()
+    conn = get_connection()
+    for chunk in iter_source_chunks(path, GROUP_COLUMNS, chunk_rows):
+        report["rows"] += len(chunk)
+        valid = (chunk['group_name'] != '') & (chunk['creator'] != '')
+        report["invalid"] += int((~valid).sum())
+        rows = [(g, c, c) for g, c in chunk[valid].to_numpy(dtype=object).tolist()]
+        written = load_chunk(conn, GROUP_SQL[on_conflict], rows)
+        report["written"] += written
+        report["skipped"] += len(rows) - written
+    report["seconds"] = time.perf_counter() - started
+    return report
+
+def print_report(label: str, report: dict, on_conflict: str):
+    action = "新增" if on_conflict == "ignore" else "新增或更新"
+    print(f"{label}: 读取 {report['rows']} 行，{action} {report['written']}，"
+          f"跳过 {report['skipped']}，无效 {report['invalid']}（{report['seconds']:.2f}s）")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Bulk user and group import (.xlsx, .csv or .parquet)')
+    parser.add_argument('--users', default='user_inform/users.xlsx',
+                        help='User source with username, password(_hash), role, group(_name) columns')
+    parser.add_argument('--groups', default='user_inform/groups.xlsx',
+                        help='Group source with group_name, creator columns')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help=f'Rows per read chunk and transaction (default: {CHUNK_ROWS})')
+    parser.add_argument('--upsert', action='store_true',
+                        help='Update existing users/groups instead of skipping them')
+    parser.add_argument('--hash-passwords', action='store_true',
+                        help='The password column holds plain text; hash it before storing')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    on_conflict = "update" if args.upsert else "ignore"
+    chunk_rows = max(1, args.chunk_rows)
+    init_db()
+    failed = False
+    # 先导入用户：群组的创建者必须已存在
+    for label, path, migrate in [
+        ("用户", args.users, lambda p: migrate_users(p, chunk_rows, on_conflict, args.hash_passwords)),
+        ("群组", args.groups, lambda p: migrate_groups(p, chunk_rows, on_conflict)),
+    ]:
+        if not Path(path).exists():
+            print(f"{label}源文件不存在，跳过: {path}")
+            continue
+        try:
+            print_report(label, migrate(path), on_conflict)
+        except Exception as e:
+            print(f"{label}迁移失败: {str(e)}")
+            failed = True
+    print("\n迁移完成！数据库位置:", DB_PATH.resolve())
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,139 @@
+# mock_ollama.py
+# Offline stand-in for the Ollama /api/chat endpoint, used by benchmark_analysis.py
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CRITERIA = ["participation", "initiative", "problem_solving", "coordination", "responsiveness"]
+
+class MockConfig:
+    """Behaviour knobs shared by all request handlers"""
+    def __init__(self, latency=0.0, malformed_rate=0.0, eval_tokens=200, seed=0):
+        self.latency = latency
+        self.malformed_rate = malformed_rate
+        self.eval_tokens = eval_tokens
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def next_is_malformed(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            return self.rng.random() < self.malformed_rate
+
+def render_reply(context: str, malformed: bool) -> str:
+    """Templated analysis whose scores depend only on the prompt context"""
+    digest = hashlib.sha256(context.encode('utf-8')).digest()
+    if malformed:
+        # Truncated object: fails both json.loads and the regex repair path
+        return '<think>checking the chat</think>{"feedback": "Incomplete'
+    reply = {
+        "feedback": f"Mock analysis of {context.count(chr(10)) + 1} messages.",
+        "scores": {k: 1 + digest[i] % 5 for i, k in enumerate(CRITERIA)},
+        "mentions": [],
+        "version": "mock"
+    }
+    return json.dumps(reply, ensure_ascii=False)
+
+def make_handler(config: MockConfig):
+    class ChatHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path != "/api/chat":
+                self._send_json(404, {"error": f"unsupported endpoint {self.path}"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            messages = request.get("messages", [])
+            context = messages[-1].get("content", "") if messages else ""
+
+            if config.latency:
+                time.sleep(config.latency)
+            content = render_reply(context, config.next_is_malformed())
+            base = {
+                "model": request.get("model", "mock"),
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+            final = {
+                **base,
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": len(context) // 4,
+                "eval_count": config.eval_tokens,
+            }
+
+            if not request.get("stream", True):
+                self._send_json(200, {**final, "message": {"role": "assistant", "content": content}})
+                return
+
+            # NDJSON stream, one line per small chunk, then the summary line
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i in range(0, len(content), 4):
+                    self._write_chunk({**base, "done": False,
+                                       "message": {"role": "assistant", "content": content[i:i + 4]}})
+                self._write_chunk({**final, "message": {"role": "assistant", "content": ""}})
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Client stopped reading early
+
+        def _write_chunk(self, payload: dict):
+            line = (json.dumps(payload) + "\n").encode('utf-8')
+            self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+
+    return ChatHandler
+
+class MockServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # A streaming client that stops early resets the connection, often while
+        # the handler waits for the next keep-alive request; that is expected
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+def start_server(config: MockConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the mock in a daemon thread; port 0 picks a free port"""
+    server = MockServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Mock Ollama chat server')
+    parser.add_argument('--port', type=int, default=11435, help='Listen port (default: 11435)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of delay per request')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Share of replies that are invalid JSON')
+    parser.add_argument('--eval-tokens', type=int, default=200, help='eval_count reported per reply')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the malformed-reply sampling')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    config = MockConfig(args.latency, args.malformed_rate, args.eval_tokens, args.seed)
+    server = MockServer(("127.0.0.1", args.port), make_handler(config))
+    print(f"Mock Ollama listening on http://127.0.0.1:{args.port} (set OLLAMA_HOST to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -2,7 +2,39 @@
 import pandas as pd
 import re
 import sys
+import os
+import time
+import json
+import hashlib
+import csv
+from itertools import chain
+from collections import Counter
+import argparse
 from datetime import datetime
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from openpyxl import Workbook, load_workbook
+from chat_io import detect_format, with_format, write_chat_file, read_chat_file, ColumnarBatchWriter
+
+ESSENTIAL_COLUMNS = ['CreateTime', 'talker', 'type_name', 'msg']
+VALID_TYPES = ['文本', '文件', '引用回复', '图片']
+# type_name 以固定类别编码，白名单外的类型编码为 -1
+TYPE_DTYPE = pd.CategoricalDtype(VALID_TYPES)
+BATCH_ROWS = 10000
+# 修改清洗规则时递增，使已有输出的缓存失效
+RULES_VERSION = "1"
+MANIFEST_NAME = ".preprocess_manifest.json"
+INPUT_SUFFIXES = ('.xlsx', '.csv', '.jsonl', '.ndjson')
+
+# CSV/JSONL 导出工具的常见字段名 -> 标准列
+COLUMN_ALIASES = {
+    'CreateTime': ['CreateTime', 'create_time', 'createTime', 'StrTime', 'timestamp', 'datetime', 'time'],
+    'talker': ['talker', 'sender', 'from_user', 'from', 'wxid', 'NickName', 'user'],
+    'type_name': ['type_name', 'msg_type', 'message_type', 'type'],
+    'msg': ['msg', 'StrContent', 'content', 'message', 'text', 'body'],
+}
+SESSION_GAP_MINUTES = 30
+EPOCH_PATTERN = re.compile(r'^\d{10}(\d{3})?$')
 
 def validate_input_file(input_path):
     try:
@@ -28,46 +60,518 @@ def clean_message(msg):
     # 去除首尾空白
     return msg.strip()
 
-def main(input_path="input_form/test4.xlsx", output_path="output_form/cleaned_chat4.xlsx"):
-    if not validate_input_file(input_path):
-        sys.exit(1)
-        
+# 预编译的清洗规则，顺序与 clean_message 一致
+TAG_PATTERN = re.compile(r'<.*?>')
+URL_PATTERN = re.compile(r'http\S+')
+FILE_PATTERN = re.compile(r'FileStorage\\\S+')
+
+def _clean_one(msg):
+    # 只有包含规则前缀时才调用正则，各规则按原顺序依次作用
+    if '<' in msg:
+        msg = TAG_PATTERN.sub('', msg)
+    if 'http' in msg:
+        msg = URL_PATTERN.sub('[链接]', msg)
+    if 'FileStorage\\' in msg:
+        msg = FILE_PATTERN.sub('[文件]', msg)
+    return msg.strip()
+
+def clean_messages(msgs):
+    """整列清洗，结果与逐行 clean_message 完全一致"""
+    values = msgs.astype(object).where(msgs.notna(), "")
+    return pd.Series(
+        [_clean_one(v if isinstance(v, str) else str(v)) for v in values],
+        index=msgs.index
+    )
+
+def new_stats():
+    """逐条规则的行数统计"""
+    return {"rows_in": 0, "dropped_type": 0, "dropped_empty": 0, "dropped_time": 0, "kept": 0}
+
+def filter_and_clean(df, stats=None):
+    """类型过滤、消息清洗并删除无效记录（整表与分批模式共用）"""
+    df = df[ESSENTIAL_COLUMNS]
+    rows_in = len(df)
+
+    # 过滤无效消息类型后再转为类别列（类别外的值直接转换会被 pandas 弃用），talker 同样转为类别列
+    valid = df['type_name'].isin(VALID_TYPES).to_numpy()
+    df = df[valid].copy()
+    df['type_name'] = df['type_name'].astype(TYPE_DTYPE)
+    df['talker'] = df['talker'].astype('category')
+
+    # 数据清洗
+    df['msg'] = clean_messages(df['msg'])
+    df['CreateTime'] = pd.to_datetime(df['CreateTime'], errors='coerce')
+
+    # 删除空消息和时间无效的记录
+    empty = df['msg'] == ''
+    bad_time = df['CreateTime'].isna()
+    if stats is not None:
+        stats["rows_in"] += rows_in
+        stats["dropped_type"] += rows_in - len(df)
+        stats["dropped_empty"] += int(empty.sum())
+        stats["dropped_time"] += int((~empty & bad_time).sum())
+        stats["kept"] += int((~empty & ~bad_time).sum())
+    df = df[~empty & ~bad_time]
+    df['talker'] = df['talker'].cat.remove_unused_categories()
+    return df
+
+def iter_excel_batches(input_path, batch_rows=BATCH_ROWS):
+    """以只读模式逐行读取Excel，每次产出 batch_rows 行的 DataFrame（字符串列）"""
+    wb = load_workbook(input_path, read_only=True)
     try:
-        # 读取原始数据并转换为字符串类型）
-        df = pd.read_excel(
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(h) if h is not None else '' for h in next(rows, [])]
+        missing = [c for c in ESSENTIAL_COLUMNS if c not in header]
+        if missing:
+            raise KeyError(f"Missing columns: {missing}")
+        positions = [header.index(c) for c in ESSENTIAL_COLUMNS]
+
+        batch = []
+        for row in rows:
+            # 与 dtype=str, keep_default_na=False 的整表读取保持一致
+            batch.append([
+                '' if i >= len(row) or row[i] is None else str(row[i])
+                for i in positions
+            ])
+            if len(batch) >= batch_rows:
+                yield pd.DataFrame(batch, columns=ESSENTIAL_COLUMNS)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=ESSENTIAL_COLUMNS)
+    finally:
+        wb.close()
+
+def resolve_columns(fields):
+    """按别名把导出字段映射到标准列；缺少 type_name 时视为纯文本导出"""
+    mapping = {}
+    for column, aliases in COLUMN_ALIASES.items():
+        mapping[column] = next((a for a in aliases if a in fields), None)
+    missing = [c for c, f in mapping.items() if f is None and c != 'type_name']
+    if missing:
+        raise KeyError(f"Missing columns: {missing} (found: {list(fields)})")
+    return mapping
+
+def _normalize_value(column, value):
+    """与 dtype=str 读取一致：空值为 ''；Unix 秒/毫秒时间戳转为时间字符串"""
+    if value is None:
+        return ''
+    if column == 'CreateTime' and not isinstance(value, bool) and (
+            isinstance(value, (int, float)) or EPOCH_PATTERN.match(str(value))):
+        seconds = float(value)
+        if seconds > 1e11:
+            seconds /= 1000
+        return datetime.fromtimestamp(seconds).strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)
+
+def iter_record_batches(records, mapping, batch_rows=BATCH_ROWS):
+    """把逐条记录（dict）转换为标准列的 DataFrame 批次，不整体载入"""
+    batch = []
+    for record in records:
+        batch.append([
+            _normalize_value(column, record.get(field)) if field else '文本'
+            for column, field in ((c, mapping[c]) for c in ESSENTIAL_COLUMNS)
+        ])
+        if len(batch) >= batch_rows:
+            yield pd.DataFrame(batch, columns=ESSENTIAL_COLUMNS)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch, columns=ESSENTIAL_COLUMNS)
+
+def iter_csv_batches(input_path, batch_rows=BATCH_ROWS):
+    """逐行读取 CSV 导出（兼容 BOM）"""
+    with open(input_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        mapping = resolve_columns(reader.fieldnames or [])
+        yield from iter_record_batches(reader, mapping, batch_rows)
+
+def _iter_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+def iter_jsonl_batches(input_path, batch_rows=BATCH_ROWS):
+    """逐行读取 JSON Lines 导出，字段以第一条记录为准"""
+    with open(input_path, 'r', encoding='utf-8-sig') as f:
+        records = _iter_jsonl(f)
+        first = next(records, None)
+        if first is None:
+            return
+        mapping = resolve_columns(first.keys())
+        yield from iter_record_batches(chain([first], records), mapping, batch_rows)
+
+def iter_input_batches(input_path, batch_rows=BATCH_ROWS):
+    """按后缀选择 Excel / CSV / JSONL 的分批读取器"""
+    suffix = Path(input_path).suffix.lower()
+    if suffix == '.csv':
+        return iter_csv_batches(input_path, batch_rows)
+    if suffix in ('.jsonl', '.ndjson'):
+        return iter_jsonl_batches(input_path, batch_rows)
+    return iter_excel_batches(input_path, batch_rows)
+
+def read_input(input_path):
+    """整表读取原始导出（字符串列）"""
+    if Path(input_path).suffix.lower() == '.xlsx':
+        return pd.read_excel(
             input_path,
             sheet_name=0,
             dtype=str,
             keep_default_na=False
         )
-        
-        # 列处理
-        essential_columns = ['CreateTime', 'talker', 'type_name', 'msg']
-        df = df[essential_columns]
-        
-        # 过滤无效消息类型
-        valid_types = ['文本', '文件', '引用回复', '图片']
-        df = df[df['type_name'].isin(valid_types)]
-        
-        # 数据清洗
-        df['msg'] = df['msg'].apply(clean_message)
-        df['CreateTime'] = pd.to_datetime(df['CreateTime'], errors='coerce')
-        
-        # 删除空消息和时间无效的记录
-        df = df[(df['msg'] != '') & (df['CreateTime'].notna())]
-        
+    batches = list(iter_input_batches(input_path))
+    return pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=ESSENTIAL_COLUMNS)
+
+def assign_sessions(df, gap_minutes=SESSION_GAP_MINUTES, state=None):
+    """按时间间隔切分会话：相邻 CreateTime 间隔超过 gap_minutes 即开始新会话
+
+    向量化实现（diff + cumsum），要求 df 已按 CreateTime 排序。state 用于
+    分批模式在批次之间延续上一条时间和会话编号，会被原地更新。
+    """
+    if state is None:
+        state = {"last_time": None, "last_id": 0}
+    df = df.copy()
+    if df.empty:
+        df['session_id'] = pd.Series(dtype='int64')
+        return df
+
+    times = df['CreateTime']
+    gaps = times.diff()
+    gaps.iloc[0] = times.iloc[0] - state["last_time"] if state["last_time"] is not None else pd.NaT
+    starts = (gaps > pd.Timedelta(minutes=gap_minutes)).to_numpy(copy=True)
+    if state["last_time"] is None:
+        starts[0] = True
+    df['session_id'] = state["last_id"] + starts.cumsum()
+
+    state["last_time"] = times.iloc[-1]
+    state["last_id"] = int(df['session_id'].iloc[-1])
+    return df
+
+def with_sessions(batches, gap_minutes):
+    """分批模式下的会话标注（输入需按时间顺序导出）"""
+    state = {"last_time": None, "last_id": 0}
+    for df in batches:
+        yield assign_sessions(df, gap_minutes, state)
+
+def stream_to_excel(batches, output_path):
+    """分批写出到只写模式的工作簿，返回写出的记录数"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    header = None
+    written = 0
+    for df in batches:
+        if header is None:
+            header = list(df.columns)
+            ws.append(header)
+        for row in df.itertuples(index=False):
+            ws.append([v.to_pydatetime() if isinstance(v, pd.Timestamp) else v for v in row])
+        written += len(df)
+    if header is None:
+        ws.append(ESSENTIAL_COLUMNS)
+    wb.save(output_path)
+    return written
+
+def stream_to_file(batches, output_path):
+    """按输出文件后缀选择 xlsx 或列式（Parquet/Feather）分批写出"""
+    if detect_format(output_path) == "xlsx":
+        return stream_to_excel(batches, output_path)
+    writer = ColumnarBatchWriter(output_path, ESSENTIAL_COLUMNS)
+    written = 0
+    try:
+        for df in batches:
+            writer.write(df)
+            written += len(df)
+    except BaseException:
+        # 失败时不留下看似有效的（空）输出文件
+        writer.abort()
+        raise
+    writer.close()
+    return written
+
+def _report_batches(batches, stats, progress):
+    """每写出一批回调一次 progress(stats)"""
+    for df in batches:
+        yield df
+        progress(dict(stats))
+
+def process_file(input_path, output_path, stream=False, batch_rows=BATCH_ROWS, export_xlsx=False,
+                 session_gap=None, progress=None):
+    """预处理单个导出文件，返回规则统计；失败时抛出异常
+
+    session_gap（分钟）不为 None 时追加 session_id 列。
+    progress(stats) 在流式模式下每批回调一次，否则在完成时回调一次。
+    """
+    stats = new_stats()
+    if stream:
+        # 分批读取、清洗、写出，内存占用与输入大小基本无关
+        batches = (filter_and_clean(batch, stats) for batch in iter_input_batches(input_path, batch_rows))
+        if progress:
+            batches = _report_batches(batches, stats, progress)
+        if session_gap is not None:
+            batches = with_sessions(batches, session_gap)
+        stream_to_file(batches, output_path)
+    else:
+        # 读取原始数据并转换为字符串类型）
+        df = read_input(input_path)
+
+        df = filter_and_clean(df, stats)
+        if session_gap is not None:
+            df = assign_sessions(df.sort_values('CreateTime', kind='stable'), session_gap)
+
         # 生成输出文件
-        df.to_excel(output_path, index=False, engine='openpyxl')
-        print(f"Successfully processed {len(df)} records")
+        write_chat_file(df, output_path)
+
+    # 列式输出时可选导出一份供人工查看的 xlsx
+    if export_xlsx:
+        export_xlsx_copy(output_path, None if stream else df)
+    if progress and not stream:
+        progress(dict(stats))
+    return stats
+
+def export_xlsx_copy(output_path, df=None):
+    """在 Parquet/Feather 输出旁写一份 xlsx；未给出 df 时从输出文件读取"""
+    if detect_format(output_path) == "xlsx":
+        return
+    xlsx_path = with_format(output_path, "xlsx")
+    write_chat_file(df if df is not None else read_chat_file(output_path), xlsx_path)
+    print(f"Excel copy saved to: {xlsx_path}")
+
+def xlsx_copy_missing(output_path):
+    """列式输出缺少（或旧于输出的）xlsx 副本"""
+    if detect_format(output_path) == "xlsx":
+        return False
+    xlsx_path = with_format(output_path, "xlsx")
+    return not xlsx_path.exists() or xlsx_path.stat().st_mtime < Path(output_path).stat().st_mtime
+
+def rules_fingerprint(session_gap=None):
+    """清洗规则版本标识（版本号 + 类型白名单 + 正则 + 会话切分参数）"""
+    rules = [RULES_VERSION, VALID_TYPES, TAG_PATTERN.pattern, URL_PATTERN.pattern, FILE_PATTERN.pattern,
+             session_gap]
+    return hashlib.sha256(json.dumps(rules, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def manifest_path(output_path):
+    return Path(output_path).parent / MANIFEST_NAME
+
+def load_manifest(output_path):
+    """读取输出目录下的预处理清单：输出文件名 -> 输入哈希、规则版本、统计"""
+    path = manifest_path(output_path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def lookup_cached(input_path, output_path, input_hash, rules):
+    """输入内容与规则均未变化且输出仍在时返回上次的统计，否则返回 None"""
+    entry = load_manifest(output_path).get(Path(output_path).name)
+    output = Path(output_path)
+    if (entry and entry["input_sha256"] == input_hash
+            and entry["rules"] == rules
+            and output.exists() and output.stat().st_size == entry["output_size"]):
+        return entry["stats"]
+    return None
+
+def record_manifest(entries):
+    """entries: [(input_path, output_path, input_hash, stats, rules)]，按输出目录合并写入清单"""
+    by_dir = {}
+    for entry in entries:
+        by_dir.setdefault(manifest_path(entry[1]), []).append(entry)
+    for path, items in by_dir.items():
+        manifest = load_manifest(items[0][1])
+        for input_path, output_path, input_hash, stats, rules in items:
+            manifest[Path(output_path).name] = {
+                "input": str(input_path),
+                "input_sha256": input_hash,
+                "rules": rules,
+                "output_size": Path(output_path).stat().st_size,
+                "stats": stats,
+                "processed_at": datetime.now().isoformat()
+            }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+def preprocess(input_path, output_path, stream=False, batch_rows=BATCH_ROWS, export_xlsx=False,
+               force=False, session_gap=None, progress=None):
+    """进程内预处理入口（命令行与界面共用），返回结构化结果；失败时抛出异常
+
+    未变化的输入直接复用已有输出，结果中 cached 为 True。
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Input file {input_path} does not exist")
+    started = time.perf_counter()
+    input_hash = file_sha256(input_path)
+    rules = rules_fingerprint(session_gap)
+    cached = None if force else lookup_cached(input_path, output_path, input_hash, rules)
+    if cached is not None:
+        stats = cached
+        # 清单不记录 xlsx 副本：命中缓存时按需从已有输出补写
+        if export_xlsx and xlsx_copy_missing(output_path):
+            export_xlsx_copy(output_path)
+    else:
+        stats = process_file(input_path, output_path, stream, batch_rows, export_xlsx, session_gap, progress)
+        record_manifest([(input_path, output_path, input_hash, stats, rules)])
+    return {
+        "input": str(input_path),
+        "output": str(output_path),
+        "seconds": time.perf_counter() - started,
+        "stats": stats,
+        "error": "",
+        "cached": cached is not None
+    }
+
+def main(input_path="input_form/test4.xlsx", output_path="output_form/cleaned_chat4.xlsx",
+         stream=False, batch_rows=BATCH_ROWS, export_xlsx=False, force=False, session_gap=None):
+    if not validate_input_file(input_path):
+        sys.exit(1)
+
+    try:
+        result = preprocess(input_path, output_path, stream, batch_rows, export_xlsx, force, session_gap)
+        if result["cached"]:
+            print(f"Cached: {input_path} is unchanged, {result['stats']['kept']} records already in {output_path}")
+            return
+        print(f"Successfully processed {result['stats']['kept']} records")
         print(f"Output file saved to: {output_path}")
-        
+
     except Exception as e:
         print(f"Error during processing: {str(e)}")
         sys.exit(1)
 
+def discover_inputs(input_dir="input_form"):
+    """input_form 下所有待处理的导出文件（xlsx/csv/jsonl，跳过 Excel 锁文件 ~$）"""
+    return sorted(
+        f for f in Path(input_dir).iterdir()
+        if f.is_file() and f.suffix.lower() in INPUT_SUFFIXES and not f.name.startswith('~$')
+    )
+
+def batch_output_paths(inputs, output_dir, fmt):
+    """每个输入对应的输出路径；同名不同后缀的输入（a.xlsx 与 a.csv）保留原后缀以免互相覆盖"""
+    stems = Counter(f.stem for f in inputs)
+    return {
+        f: Path(output_dir) / (f"{f.name}.{fmt}" if stems[f.stem] > 1 else f"{f.stem}.{fmt}")
+        for f in inputs
+    }
+
+def _process_job(job):
+    """进程池任务：处理一个文件并计时，异常转为结果中的 error"""
+    input_path, output_path, stream, batch_rows, session_gap = job
+    started = time.perf_counter()
+    try:
+        stats = process_file(input_path, output_path, stream, batch_rows, session_gap=session_gap)
+        error = ""
+    except Exception as e:
+        stats, error = new_stats(), f"{type(e).__name__}: {str(e)}"
+    return {
+        "input": str(input_path),
+        "output": str(output_path),
+        "seconds": time.perf_counter() - started,
+        "stats": stats,
+        "error": error
+    }
+
+def run_batch(input_dir="input_form", output_dir="output_form", fmt="xlsx",
+              stream=False, batch_rows=BATCH_ROWS, workers=None, force=False, session_gap=None,
+              progress=None, verbose=True):
+    """用进程池并行处理目录下的所有导出文件，每个输入生成一个输出
+
+    progress(done, total, result) 在每个文件完成（或命中缓存）后回调。
+    """
+    inputs = discover_inputs(input_dir)
+    if not inputs:
+        if verbose:
+            print(f"No input files found in {input_dir}")
+        return []
+    Path(output_dir).mkdir(exist_ok=True)
+
+    started = time.perf_counter()
+    rules = rules_fingerprint(session_gap)
+    results, jobs, hashes = {}, [], {}
+    outputs = batch_output_paths(inputs, output_dir, fmt)
+    for f in inputs:
+        output_path = outputs[f]
+        hashes[str(f)] = file_sha256(f)
+        cached = None if force else lookup_cached(f, output_path, hashes[str(f)], rules)
+        if cached is not None:
+            results[str(f)] = {"input": str(f), "output": str(output_path), "seconds": 0.0,
+                               "stats": cached, "error": "", "cached": True}
+            if progress:
+                progress(len(results), len(inputs), results[str(f)])
+        else:
+            jobs.append((f, output_path, stream, batch_rows, session_gap))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for r in pool.map(_process_job, jobs):
+                results[r["input"]] = r
+                if progress:
+                    progress(len(results), len(inputs), r)
+        record_manifest([(r["input"], r["output"], hashes[r["input"]], r["stats"], rules)
+                         for r in results.values() if not r["error"] and not r.get("cached")])
+
+    ordered = [results[str(f)] for f in inputs]
+    if verbose:
+        print_batch_summary(ordered, time.perf_counter() - started, workers)
+    return ordered
+
+def print_batch_summary(results, elapsed, workers):
+    totals = new_stats()
+    print(f"\n{'file':<30} {'kept':>8} {'type':>7} {'empty':>7} {'time':>6} {'sec':>7}")
+    for r in results:
+        name = Path(r["input"]).name
+        if r["error"]:
+            print(f"{name:<30} FAILED  {r['error']}")
+            continue
+        st = r["stats"]
+        for k in totals:
+            totals[k] += st[k]
+        print(f"{name:<30} {st['kept']:>8} {st['dropped_type']:>7} {st['dropped_empty']:>7} "
+              f"{st['dropped_time']:>6} {'cached' if r.get('cached') else format(r['seconds'], '7.2f'):>7}")
+    failed = sum(1 for r in results if r["error"])
+    print(f"{'TOTAL':<30} {totals['kept']:>8} {totals['dropped_type']:>7} {totals['dropped_empty']:>7} "
+          f"{totals['dropped_time']:>6} {elapsed:>7.2f}")
+    print(f"{len(results) - failed}/{len(results)} files processed with {workers} workers, "
+          f"{totals['rows_in']} rows read")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Chat export preprocessing tool')
+    parser.add_argument('input', nargs='?', default="input_form/test4.xlsx",
+                        help='Raw chat export (.xlsx, .csv or .jsonl)')
+    parser.add_argument('output', nargs='?', default="output_form/cleaned_chat4.xlsx", help='Cleaned output file')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read, clean and write in fixed-size batches with bounded memory')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS,
+                        help=f'Rows per batch in streaming mode (default: {BATCH_ROWS})')
+    parser.add_argument('--format', choices=['parquet', 'feather', 'xlsx'],
+                        help='Output format; replaces the output suffix (default: taken from the suffix)')
+    parser.add_argument('--export-xlsx', action='store_true',
+                        help='Also write an .xlsx copy next to a Parquet/Feather output')
+    parser.add_argument('--batch', action='store_true',
+                        help='Process every export in --input-dir in parallel')
+    parser.add_argument('--input-dir', default='input_form', help='Batch mode input directory (default: input_form)')
+    parser.add_argument('--output-dir', default='output_form', help='Batch mode output directory (default: output_form)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Batch mode process count (default: number of CPU cores)')
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild outputs even when the input and cleaning rules are unchanged')
+    parser.add_argument('--sessions', action='store_true',
+                        help='Annotate rows with a session_id split on time gaps')
+    parser.add_argument('--session-gap', type=float, default=SESSION_GAP_MINUTES,
+                        help=f'Minutes of silence that start a new session (default: {SESSION_GAP_MINUTES})')
+    return parser.parse_args()
+
 if __name__ == "__main__":
     # 使用示例（支持命令行参数）
-    if len(sys.argv) == 3:
-        main(sys.argv[1], sys.argv[2])
-    else:
-        main()
\ No newline at end of file
+    args = parse_args()
+    session_gap = args.session_gap if args.sessions else None
+    if args.batch:
+        results = run_batch(args.input_dir, args.output_dir, args.format or "xlsx",
+                            args.stream, max(1, args.batch_rows), args.workers, args.force, session_gap)
+        sys.exit(1 if any(r["error"] for r in results) else 0)
+    output = str(with_format(args.output, args.format)) if args.format else args.output
+    main(args.input, output, stream=args.stream, batch_rows=max(1, args.batch_rows),
+         export_xlsx=args.export_xlsx, force=args.force, session_gap=session_gap)